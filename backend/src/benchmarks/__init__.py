@@ -0,0 +1,6 @@
+"""
+Бенчмарки поиска и загрузки CMSE.
+
+Запуск из каталога backend/src, например:
+    python -m benchmarks.search --db-url postgresql://... --scales 1000 10000
+"""
@@ -0,0 +1,195 @@
+"""
+Бенчмарк входа: пропускная способность bcrypt и /auth_user работающего бэкенда под всплеском входов.
+
+Без --url замеряется только PasswordHasher в этом процессе: время одного хеша для каждой стоимости из
+--rounds и пропускная способность пула при разном числе потоков - чтобы выбрать BCRYPT_ROUNDS и
+AUTH_HASH_WORKERS. С --redis-host замеряется проверка токена сессии - то, во что обходится каждый
+аутентифицированный запрос. С --url создаются --users пользователей bench_auth_*, затем --concurrency
+клиентов входят одновременно, а отдельный поток всё это время опрашивает GET /: его задержка показывает,
+не блокирует ли хеширование остальные запросы; после этого замеряется GET /me с токеном.
+
+Результат печатается (или пишется в --output) в JSON, как у benchmarks.search.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.search import _timed, git_commit, percentiles
+from modules.session_controller import SessionStore
+from modules.users_controller import PasswordHasher, HasherBusy
+
+
+def bench_rounds(rounds, samples=5):
+    """Время одного hash и verify в миллисекундах для каждой стоимости."""
+    results = []
+    for cost in rounds:
+        hasher = PasswordHasher(rounds=cost, workers=1)
+        hashed = hasher.hash_sync("benchmark-password")
+        hash_times, verify_times = [], []
+        for _ in range(samples):
+            start = time.perf_counter()
+            hasher.hash_sync("benchmark-password")
+            hash_times.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            hasher.verify_sync("benchmark-password", hashed)
+            verify_times.append(time.perf_counter() - start)
+        results.append({"rounds": cost, "hash": percentiles(hash_times), "verify": percentiles(verify_times)})
+    return results
+
+
+def bench_hasher(rounds, workers, operations, max_queue):
+    """Пропускная способность пула: operations проверок пароля, запущенных одновременно."""
+    hasher = PasswordHasher(rounds=rounds, workers=workers, max_queue=max_queue)
+    hashed = hasher.hash_sync("benchmark-password")
+
+    async def one():
+        start = time.perf_counter()
+        try:
+            await hasher.verify("benchmark-password", hashed)
+        except HasherBusy:
+            return None
+        return time.perf_counter() - start
+
+    async def burst():
+        return await asyncio.gather(*(one() for _ in range(operations)))
+
+    start = time.perf_counter()
+    latencies = asyncio.run(burst())
+    seconds = time.perf_counter() - start
+    done = [latency for latency in latencies if latency is not None]
+    hasher.executor.shutdown()
+    return {"rounds": rounds, "workers": hasher.workers, "operations": operations,
+            "rejected": operations - len(done), "seconds": round(seconds, 3),
+            "verifies_per_second": round(len(done) / seconds, 1), "latency_ms": percentiles(done)}
+
+
+def bench_sessions(redis_host, count):
+    """Задержка SessionStore.validate для настоящего и поддельного токена."""
+    store = SessionStore(redis_host, ttl=600)
+    token, _ = store.issue(0, "bench_auth_session")
+    forged = token[:-4] + "AAAA"
+    valid = [_timed(store.validate, token) for _ in range(count)]
+    rejected = [_timed(store.validate, forged) for _ in range(count)]
+    store.revoke(store.validate(token))
+    return {"valid_ms": percentiles(valid), "forged_ms": percentiles(rejected)}
+
+
+def post(url, params, body=None):
+    """:return: (HTTP-статус, тело ответа)."""
+    request = urllib.request.Request(f"{url}?{urllib.parse.urlencode(params)}", method="POST",
+                                     data=json.dumps(body).encode() if body is not None else b"",
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, response.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+
+def bench_http(url, users, concurrency, logins):
+    """Всплеск входов на работающий бэкенд и задержка GET / во время него."""
+    for index in range(users):
+        post(f"{url}/register_user", {
+            "username": f"bench_auth_{index}", "email": f"bench_auth_{index}@example.com", "phone": "",
+            "name": "", "description": "", "avatar": "", "birth": "2000-01-01", "city": "",
+            "password": f"password-{index}"}, body=[])  # sports приходит телом запроса
+
+    def login(index):
+        start = time.perf_counter()
+        status, _ = post(f"{url}/auth_user", {"username": f"bench_auth_{index % users}",
+                                               "password": f"password-{index % users}"})
+        return status, time.perf_counter() - start
+
+    probes = []
+    stopped = threading.Event()
+
+    def probe():
+        while not stopped.is_set():
+            start = time.perf_counter()
+            with urllib.request.urlopen(f"{url}/") as response:
+                response.read()
+            probes.append(time.perf_counter() - start)
+            stopped.wait(0.05)
+
+    probe_thread = threading.Thread(target=probe)
+    probe_thread.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(login, range(logins)))
+    seconds = time.perf_counter() - start
+    stopped.set()
+    probe_thread.join()
+
+    statuses = {}
+    for status, _ in results:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    succeeded = [latency for status, latency in results if status == 200]
+
+    # Аутентифицированный запрос после входа: проверка токена вместо bcrypt
+    status, body = post(f"{url}/auth_user", {"username": "bench_auth_0", "password": "password-0"})
+    authenticated = []
+    if status == 200:
+        request = urllib.request.Request(f"{url}/me",
+                                         headers={"Authorization": f"Bearer {json.loads(body)['token']}"})
+
+        def me():
+            with urllib.request.urlopen(request) as response:
+                response.read()
+
+        authenticated = [_timed(me) for _ in range(logins)]
+
+    return {"users": users, "concurrency": concurrency, "logins": logins, "seconds": round(seconds, 3),
+            "logins_per_second": round(len(succeeded) / seconds, 1), "statuses": statuses,
+            "login_latency_ms": percentiles(succeeded), "probe_latency_ms": percentiles(probes),
+            "authenticated_latency_ms": percentiles(authenticated)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rounds", type=int, nargs="+", default=[10, 11, 12, 13])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--operations", type=int, default=64, help="Одновременных проверок для замера пула.")
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--redis-host", help="Redis для замера проверки токенов сессий.")
+    parser.add_argument("--url", help="Адрес работающего бэкенда для замера /auth_user по HTTP.")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--output", help="Файл для JSON-отчёта (по умолчанию stdout).")
+    args = parser.parse_args(argv)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "rounds": bench_rounds(args.rounds),
+        "hasher": [],
+    }
+    for workers in args.workers:
+        result = bench_hasher(args.rounds[0], workers, args.operations, args.max_queue)
+        report["hasher"].append(result)
+        print(f"workers={workers}: {result}", file=sys.stderr)
+    if args.redis_host:
+        report["sessions"] = bench_sessions(args.redis_host, args.logins)
+    if args.url:
+        report["http"] = bench_http(args.url, args.users, args.concurrency, args.logins)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""Генератор синтетического корпуса соревнований ЕКП."""
+import io
+import random
+from datetime import date, timedelta
+
+SPORTS = {
+    "ФУТБОЛ": ["футбол", "мини-футбол", "пляжный футбол"],
+    "ДЗЮДО": ["весовая категория 60 кг", "весовая категория 73 кг", "командные соревнования"],
+    "САМБО": ["спортивное самбо", "боевое самбо"],
+    "БОКС": ["весовая категория 57 кг", "весовая категория 80 кг"],
+    "ПЛАВАНИЕ": ["вольный стиль 100 м", "баттерфляй 200 м", "эстафета 4х100 м"],
+    "ЛЫЖНЫЕ ГОНКИ": ["спринт", "масс-старт 30 км", "эстафета"],
+    "ЛЕГКАЯ АТЛЕТИКА": ["бег 100 м", "прыжок в длину", "марафон"],
+    "ХОККЕЙ": ["хоккей"],
+    "БИАТЛОН": ["индивидуальная гонка", "спринт", "гонка преследования"],
+    "ТХЭКВОНДО": ["пхумсэ", "весовая категория 68 кг"],
+    "ФИГУРНОЕ КАТАНИЕ НА КОНЬКАХ": ["одиночное катание", "парное катание", "танцы на льду"],
+    "СПОРТИВНАЯ ГИМНАСТИКА": ["многоборье", "вольные упражнения", "опорный прыжок"],
+}
+CITIES = ["Москва", "Санкт-Петербург", "Казань", "Новосибирск", "Екатеринбург", "Сочи", "Красноярск",
+          "Нижний Новгород", "Уфа", "Ханты-Мансийск", "Омск", "Самара", "Воронеж", "Тюмень"]
+COMPOSITIONS = ["Основной состав", "Молодежный (резервный) состав"]
+CLASSES = ["ЧЕМПИОНАТ РОССИИ", "ПЕРВЕНСТВО РОССИИ", "КУБОК РОССИИ", "ВСЕРОССИЙСКИЕ СОРЕВНОВАНИЯ",
+           "ЧЕМПИОНАТ МИРА", "ПЕРВЕНСТВО ЕВРОПЫ", "МЕЖДУНАРОДНЫЕ СОРЕВНОВАНИЯ"]
+COUNTRIES = ["РОССИЯ"] * 8 + ["БЕЛАРУСЬ", "КАЗАХСТАН", "УЗБЕКИСТАН"]
+GENDERS_AND_AGES = ["мужчины", "женщины", "мужчины, женщины", "юниоры 18-20 лет", "юниорки 18-20 лет",
+                    "юноши 14-15 лет", "девушки 14-15 лет", "юноши, девушки 12-13 лет"]
+
+
+def generate_competitions(count, seed=0, year=2024):
+    """
+    Генерирует строки соревнований в том же порядке полей, что возвращает PDFParser.parse.
+
+    :param count: Количество строк.
+    :param seed: Зерно генератора, чтобы корпус был одинаковым между запусками.
+    :param year: Год календаря; номера ЕКП - 16 цифр, начинаются с года.
+    """
+    rng = random.Random(seed)
+    sport_names = list(SPORTS)
+    first_day = date(year, 1, 1)
+    for number in range(count):
+        sport_name = rng.choice(sport_names)
+        date_start = first_day + timedelta(days=rng.randrange(365))
+        yield (
+            sport_name,
+            rng.choice(COMPOSITIONS),
+            f"{year}{number:012d}",
+            date_start.isoformat(),
+            (date_start + timedelta(days=rng.randrange(8))).isoformat(),
+            rng.choice(CITIES),
+            rng.choice(SPORTS[sport_name]),
+            rng.choice(CLASSES),
+            rng.choice(COUNTRIES),
+            rng.choice([20, 50, 100, 150, 300, 500]),
+            rng.choice(GENDERS_AND_AGES),
+        )
+
+
+def _copy_value(value):
+    """Экранирует значение для текстового формата COPY."""
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+def load_competitions(conn, rows, chunk_size=50000):
+    """
+    Перезаписывает таблицу competitions переданными строками через COPY.
+
+    :return: Количество загруженных строк.
+    """
+    columns = ("sport_name", "sport_composition", "ekp_number", "date_start", "date_end", "city", "discipline",
+               "competition_class", "country", "max_people_count", "genders_and_ages")
+    total = 0
+    with conn.cursor() as cursor:
+        cursor.execute("TRUNCATE competitions RESTART IDENTITY CASCADE")
+        buffer = io.StringIO()
+        pending = 0
+        for row in rows:
+            values = [_copy_value(value) for value in row[:-1]]
+            values.append('{"' + _copy_value(row[-1]).replace('"', '\\\\"') + '"}')
+            buffer.write("\t".join(values) + "\n")
+            pending += 1
+            if pending == chunk_size:
+                buffer.seek(0)
+                cursor.copy_expert(f"COPY competitions ({', '.join(columns)}) FROM STDIN", buffer)
+                total += pending
+                buffer, pending = io.StringIO(), 0
+        if pending:
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY competitions ({', '.join(columns)}) FROM STDIN", buffer)
+            total += pending
+    conn.commit()
+    return total
+
+
+def sample_queries(count=50, seed=1):
+    """Запросы в духе реального трафика: виды спорта, города и их сочетания."""
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        parts = [rng.choice(list(SPORTS)).lower()]
+        if rng.random() < 0.5:
+            parts.append(rng.choice(CITIES))
+        if rng.random() < 0.3:
+            parts.append(rng.choice(GENDERS_AND_AGES))
+        queries.append(", ".join(parts))
+    return queries
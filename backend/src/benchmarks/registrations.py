@@ -0,0 +1,151 @@
+"""
+Бенчмарк регистрации: --registrations пользователей одновременно регистрируются на одно соревнование
+вместимостью --capacity из --threads потоков, затем --cancellations зарегистрированных отменяют
+регистрацию.
+
+Проверяется, что мест занято ровно min(capacity, registrations), счётчик registered_count совпадает
+с числом строк, остальные стоят в листе ожидания, а отмены переводят из него первых по очереди.
+Соревнование и пользователи бенчмарка удаляются в конце.
+
+Результат печатается (или пишется в --output) в JSON, как у benchmarks.search; при нарушении
+инвариантов код выхода 1.
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.search import git_commit, percentiles
+from modules.db_controller import Database
+from modules.registrations_controller import RegistrationStore
+from modules.schema import create_schema
+
+BENCH_EKP_NUMBER = "bench-registrations"
+
+
+def setup(db, capacity, registrations):
+    """:return: (id соревнования, id пользователей)."""
+    with db.cursor() as cursor:
+        cleanup(cursor)
+        cursor.execute("""
+            INSERT INTO competitions (sport_name, ekp_number, max_people_count, peoples, comments)
+            VALUES ('BENCHMARK', %s, %s, '{}', '{}') RETURNING id
+        """, (BENCH_EKP_NUMBER, capacity))
+        competition_id = cursor.fetchone()[0]
+        cursor.execute("""
+            INSERT INTO users (username, email, password)
+            SELECT 'bench_registration_' || n, 'bench_registration_' || n || '@example.com', '-'
+            FROM generate_series(1, %s) AS n
+            RETURNING id
+        """, (registrations,))
+        user_ids = sorted(row[0] for row in cursor.fetchall())
+    return competition_id, user_ids
+
+
+def cleanup(cursor):
+    cursor.execute("DELETE FROM competitions WHERE ekp_number = %s", (BENCH_EKP_NUMBER,))
+    cursor.execute("DELETE FROM users WHERE username LIKE 'bench\\_registration\\_%%'")
+
+
+def run(threads, function, arguments):
+    """Вызывает function для каждого аргумента из threads потоков; :return: (результаты, длительности, секунды)."""
+    def timed(argument):
+        start = time.perf_counter()
+        result = function(*argument)
+        return result, time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(timed, arguments))
+    return [result for result, _ in results], [latency for _, latency in results], time.perf_counter() - start
+
+
+def check(db, competition_id, capacity, expected_registered, expected_waitlisted):
+    """:return: Список нарушенных инвариантов."""
+    with db.cursor() as cursor:
+        cursor.execute("SELECT registered_count FROM competitions WHERE id = %s", (competition_id,))
+        counter = cursor.fetchone()[0]
+        cursor.execute("""
+            SELECT count(*) FILTER (WHERE status = 'registered'), count(*) FILTER (WHERE status = 'waitlisted')
+            FROM event_registrations WHERE competition_id = %s
+        """, (competition_id,))
+        registered, waitlisted = cursor.fetchone()
+    errors = []
+    if registered > capacity:
+        errors.append(f"overbooked: {registered} registered for {capacity} seats")
+    if counter != registered:
+        errors.append(f"registered_count {counter} != {registered} registered rows")
+    if registered != expected_registered:
+        errors.append(f"{registered} registered, expected {expected_registered}")
+    if waitlisted != expected_waitlisted:
+        errors.append(f"{waitlisted} waitlisted, expected {expected_waitlisted}")
+    return errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db-url", required=True, help="База для бенчмарка.")
+    parser.add_argument("--capacity", type=int, default=100)
+    parser.add_argument("--registrations", type=int, default=2000)
+    parser.add_argument("--cancellations", type=int, default=50)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--output", help="Файл для JSON-отчёта (по умолчанию stdout).")
+    args = parser.parse_args(argv)
+
+    db = Database(args.db_url, min_size=1, max_size=args.threads + 1)
+    with db.connection() as conn:
+        create_schema(conn)
+    store = RegistrationStore(db)
+    competition_id, user_ids = setup(db, args.capacity, args.registrations)
+
+    results, latencies, seconds = run(args.threads, store.register,
+                                      [(competition_id, user_id) for user_id in user_ids])
+    seated = min(args.capacity, len(user_ids))
+    errors = check(db, competition_id, args.capacity, seated, len(user_ids) - seated)
+    statuses = {status: sum(1 for result, _ in results if result == status) for status in ("registered", "waitlisted")}
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "capacity": args.capacity,
+        "threads": args.threads,
+        "register": {"operations": len(user_ids), "seconds": round(seconds, 3),
+                     "per_second": round(len(user_ids) / seconds, 1), "statuses": statuses,
+                     "latency_ms": percentiles(latencies)},
+    }
+
+    # Отмены: каждое освободившееся место должно перейти к следующему в листе ожидания
+    registered = [user_id for user_id, (status, _) in zip(user_ids, results) if status == "registered"]
+    cancelled = registered[:args.cancellations]
+    results, latencies, seconds = run(args.threads, store.unregister,
+                                      [(competition_id, user_id) for user_id in cancelled])
+    promoted = [promoted for _, promoted in results if promoted is not None]
+    waitlisted = len(user_ids) - seated
+    errors += check(db, competition_id, args.capacity, seated - len(cancelled) + len(promoted),
+                    waitlisted - len(promoted))
+    if len(promoted) != min(len(cancelled), waitlisted):
+        errors.append(f"{len(promoted)} promoted from the waitlist for {len(cancelled)} cancellations")
+    report["unregister"] = {"operations": len(cancelled), "seconds": round(seconds, 3),
+                            "promoted": len(promoted), "latency_ms": percentiles(latencies)}
+    report["errors"] = errors
+
+    with db.cursor() as cursor:
+        cleanup(cursor)
+    db.close()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    else:
+        print(output)
+    if errors:
+        print("Invariant violations: " + "; ".join(errors), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Бенчмарк поиска и загрузки: синтетический корпус -> PostgreSQL -> CompetitionSearcher.
+
+Таблица competitions в базе из --db-url перезаписывается, поэтому укажите отдельную базу.
+Результат печатается (или пишется в --output) в JSON, чтобы сравнивать коммиты между собой.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+import urllib.parse
+import urllib.request
+
+import psycopg2
+
+from benchmarks.corpus import generate_competitions, load_competitions, sample_queries
+from modules.schema import create_schema
+
+
+def percentiles(samples):
+    """p50/p95/p99 в миллисекундах по списку длительностей в секундах."""
+    if not samples:
+        return {}
+    ordered = sorted(samples)
+
+    def pick(q):
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"p50": pick(0.50), "p95": pick(0.95), "p99": pick(0.99), "count": len(ordered)}
+
+
+def peak_rss_mb():
+    # На Linux ru_maxrss в килобайтах
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def paging_mismatches(searcher, queries, page_size=10, pages=4):
+    """Число запросов, у которых страницы по offset в сумме не совпадают с одним запросом на все страницы."""
+    mismatches = 0
+    for query in queries:
+        paged = [row[0] for page in range(pages)
+                 for row, _ in searcher.search_competitions_by_keywords(query, k=page_size, offset=page * page_size)]
+        single = [row[0] for row, _ in searcher.search_competitions_by_keywords(query, k=page_size * pages)]
+        mismatches += paged != single
+    return mismatches
+
+
+def run_searcher(db_url, backend, queries, warm_rounds, result_queue):
+    """Выполняется в отдельном процессе, чтобы пиковый RSS относился только к этому индексу."""
+    from modules.db_controller import Database
+    from modules.rag_controller import CompetitionSearcher
+
+    rss_before = peak_rss_mb()
+    db = Database(db_url, max_size=2)
+    searcher = CompetitionSearcher(db, backend=backend)
+    build_seconds = _timed(searcher.refresh)
+
+    # Холодный проход: каждый запрос впервые после построения индекса
+    cold = [_timed(searcher.search_competitions_by_keywords, query) for query in queries]
+    warm = [_timed(searcher.search_competitions_by_keywords, query)
+            for _ in range(warm_rounds) for query in queries]
+    filtered = [_timed(searcher.search_filtered, {"city": "Казань"}, query) for query in queries]
+    # Весь набор запросов одним пакетом, как в POST /search/batch
+    batch = [_timed(searcher.search_many, queries) for _ in range(warm_rounds)]
+    mismatches = paging_mismatches(searcher, queries)
+    db.close()
+
+    result_queue.put({
+        "build_seconds": round(build_seconds, 3),
+        "rss_before_mb": rss_before,
+        "peak_rss_mb": peak_rss_mb(),
+        "latency_ms": {"cold": percentiles(cold), "warm": percentiles(warm), "filtered": percentiles(filtered),
+                       "batch": percentiles(batch)},
+        "batch_size": len(queries),
+        "paging_mismatches": mismatches,
+    })
+
+
+def bench_http(url, queries):
+    """Задержка /get_events работающего бэкенда: первый проход - холодный кэш, второй - тёплый."""
+    def get(query):
+        with urllib.request.urlopen(f"{url}/get_events?{urllib.parse.urlencode({'keywords': query})}") as response:
+            response.read()
+
+    cold = [_timed(get, query) for query in queries]
+    warm = [_timed(get, query) for query in queries]
+    return {"cold": percentiles(cold), "warm": percentiles(warm)}
+
+
+def bench_pdf(pdf_path, workers, engine="lines", word_cache_dir=None, layout_path=None):
+    from modules.pdf_parser import PDFParser, WordCache, WordLayout
+
+    pdf_parser = PDFParser(engine=engine)
+    word_cache = WordCache(word_cache_dir) if word_cache_dir else None
+    start = time.perf_counter()
+    # Сохранённая разметка проигрывается без исходного PDF
+    layout = WordLayout.load(layout_path) if layout_path else None
+    # Записи только считаются, как при потоковой загрузке: пиковая память не должна зависеть от размера PDF
+    rows = sum(1 for _ in pdf_parser.iter_parse(pdf_path, workers=workers, word_cache=word_cache, layout=layout))
+    return {"path": layout_path or pdf_path, "workers": workers, "engine": engine,
+            "word_cache": bool(word_cache or layout), "seconds": round(time.perf_counter() - start, 3),
+            "rows": rows, "peak_rss_mb": peak_rss_mb()}
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db-url", required=True, help="База для бенчмарка; competitions будет перезаписана.")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1000, 10000, 100000, 1000000])
+    parser.add_argument("--backends", nargs="+", default=["faiss", "sparse"])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--warm-rounds", type=int, default=5)
+    parser.add_argument("--url", help="Адрес работающего бэкенда для замера /get_events по HTTP.")
+    parser.add_argument("--pdf", help="PDF календаря ЕКП для замера PDFParser.")
+    parser.add_argument("--pdf-workers", type=int, default=1, help="Число процессов PDFParser.")
+    parser.add_argument("--pdf-engine", choices=["lines", "columns"], default="lines", help="Движок PDFParser.")
+    parser.add_argument("--pdf-word-cache", help="Каталог WordCache: повторные замеры не извлекают слова из PDF.")
+    parser.add_argument("--pdf-layout", help="Файл WordLayout (.npz) для замера разбора без исходного PDF.")
+    parser.add_argument("--output", help="Файл для JSON-отчёта (по умолчанию stdout).")
+    args = parser.parse_args(argv)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "results": [],
+    }
+    queries = sample_queries(args.queries)
+    context = multiprocessing.get_context("spawn")
+
+    conn = psycopg2.connect(args.db_url)
+    create_schema(conn)
+    for scale in args.scales:
+        load_seconds = _timed(load_competitions, conn, generate_competitions(scale))
+        for backend in args.backends:
+            result_queue = context.Queue()
+            process = context.Process(target=run_searcher,
+                                      args=(args.db_url, backend, queries, args.warm_rounds, result_queue))
+            process.start()
+            process.join()
+            result = {"scale": scale, "backend": backend, "load_seconds": round(load_seconds, 3)}
+            if process.exitcode == 0:
+                result.update(result_queue.get())
+            else:
+                # Например, плотный FAISS на миллионе строк не помещается в память
+                result["error"] = f"worker exited with code {process.exitcode}"
+            report["results"].append(result)
+            print(f"scale={scale} backend={backend}: {result}", file=sys.stderr)
+        if args.url:
+            report.setdefault("http", []).append({"scale": scale, **bench_http(args.url, queries)})
+    conn.close()
+
+    if args.pdf or args.pdf_layout:
+        report["pdf"] = bench_pdf(args.pdf, args.pdf_workers, args.pdf_engine, args.pdf_word_cache, args.pdf_layout)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
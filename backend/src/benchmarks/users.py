@@ -0,0 +1,137 @@
+"""
+Бенчмарк поиска пользователей: UserManager.find_users на --users сгенерированных пользователях.
+
+Пользователи bench_users_* получают город из --cities (распределение неравномерное, как у реальных
+городов) и 1-3 вида спорта из --sports. Замеряются поиск по городу, по городу и виду спорта (@>), по
+любому из видов спорта (&&), листание глубоких страниц по курсору и, для сравнения, прежний
+get_user(city=...). В отчёт попадает план каждого запроса. Пользователи бенчмарка удаляются в конце,
+если не задан --keep.
+
+Результат печатается (или пишется в --output) в JSON, как у benchmarks.search.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import time
+
+from benchmarks.search import _timed, git_commit, percentiles
+from modules.db_controller import Database
+from modules.schema import create_schema
+from modules.users_controller import UserManager, USER_SEARCH_COLUMNS
+
+BENCH_PREFIX = "bench_users_"
+
+
+def setup(db, users, cities, sports):
+    """Создаёт пользователей одним INSERT ... SELECT; :return: секунды."""
+    start = time.perf_counter()
+    with db.cursor() as cursor:
+        cleanup(cursor)
+        # Город: квадрат равномерного числа - первые города заметно крупнее остальных
+        cursor.execute("""
+            INSERT INTO users (username, email, password, city, sports)
+            SELECT %(prefix)s || n, %(prefix)s || n || '@example.com', '-',
+                   'city_' || floor(%(cities)s * random() ^ 2)::INTEGER,
+                   ARRAY(SELECT DISTINCT 'sport_' || floor(%(sports)s * random())::INTEGER
+                         FROM generate_series(1, 1 + (n %% 3)))
+            FROM generate_series(1, %(users)s) AS n
+        """, {"prefix": BENCH_PREFIX, "users": users, "cities": cities, "sports": sports})
+        cursor.execute("ANALYZE users")
+    return time.perf_counter() - start
+
+
+def cleanup(cursor):
+    cursor.execute("DELETE FROM users WHERE username LIKE 'bench\\_users\\_%%'")
+
+
+def explain(db, filters):
+    """План запроса find_users с подставленными значениями (без PREPARE)."""
+    conditions, values = ["id > 0"], []
+    for column, operator, value in filters:
+        conditions.append(f"{column} {operator} %s" + ("::varchar[]" if isinstance(value, list) else ""))
+        values.append(value)
+    with db.cursor() as cursor:
+        cursor.execute(f"EXPLAIN SELECT {', '.join(USER_SEARCH_COLUMNS)} FROM users "
+                       f"WHERE {' AND '.join(conditions)} ORDER BY id LIMIT 51", values)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def bench_pages(manager, pages, **filters):
+    """Листает pages страниц по курсору; :return: задержки каждой страницы."""
+    latencies, cursor = [], None
+    for _ in range(pages):
+        start = time.perf_counter()
+        _, cursor = manager.find_users(after=cursor, **filters)
+        latencies.append(time.perf_counter() - start)
+        if cursor is None:
+            break
+    return latencies
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--db-url", required=True, help="База для бенчмарка.")
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--cities", type=int, default=500)
+    parser.add_argument("--sports", type=int, default=80)
+    parser.add_argument("--queries", type=int, default=200, help="Запросов в каждом сценарии.")
+    parser.add_argument("--pages", type=int, default=50, help="Страниц при листании по курсору.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--keep", action="store_true", help="Не удалять пользователей бенчмарка.")
+    parser.add_argument("--output", help="Файл для JSON-отчёта (по умолчанию stdout).")
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    db = Database(args.db_url, min_size=1, max_size=2)
+    with db.connection() as conn:
+        create_schema(conn)
+    manager = UserManager(db)
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "users": args.users,
+        "setup_seconds": round(setup(db, args.users, args.cities, args.sports), 1),
+    }
+
+    def city():
+        return f"city_{int(args.cities * random.random() ** 2)}"
+
+    def sport():
+        return f"sport_{random.randrange(args.sports)}"
+
+    scenarios = {
+        "city": lambda: manager.find_users(city=city()),
+        "city_sport": lambda: manager.find_users(city=city(), sports_all=[sport()]),
+        "sports_any": lambda: manager.find_users(sports_any=[sport(), sport()]),
+        "get_user_city": lambda: manager.get_user(multiple=True, city=city()),
+    }
+    report["latency_ms"] = {name: percentiles([_timed(function) for _ in range(args.queries)])
+                            for name, function in scenarios.items()}
+    report["pages_latency_ms"] = {
+        "city": percentiles(bench_pages(manager, args.pages, city="city_0")),
+        "city_sport": percentiles(bench_pages(manager, args.pages, city="city_0", sports_all=["sport_0"])),
+    }
+    report["plans"] = {
+        "city": explain(db, [("city", "=", "city_0")]),
+        "city_sport": explain(db, [("city", "=", "city_7"), ("sports", "@>", ["sport_3"])]),
+        "sports_any": explain(db, [("sports", "&&", ["sport_3", "sport_4"])]),
+    }
+
+    if not args.keep:
+        with db.cursor() as cursor:
+            cleanup(cursor)
+    db.close()
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -13,106 +13,208 @@ The application includes the following main features:
 
 The application uses the FastAPI framework, PostgreSQL database, and various utility modules to implement the functionality.
 """
-from fastapi import FastAPI, File, UploadFile, HTTPException, Query
+from fastapi import FastAPI, File, UploadFile, HTTPException, Query, Request, Header, Depends
+from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel
 from typing import Dict, List, Optional
+from datetime import date
 import os
-import psycopg2
-from concurrent.futures import ThreadPoolExecutor
-from modules.pdf_parser import PDFParser
-from modules.users_controller import UserManager
-from modules.rag_controller import CompetitionSearcher
+import redis
+from modules.users_controller import UserManager, PasswordHasher, HasherBusy
+from modules.rag_controller import CompetitionSearcher, COMPETITION_COLUMNS
 from modules.router_conroller import TravelService
+from modules.cache_controller import SearchCache
+from modules.schema import create_schema
+from modules.suggest_controller import SuggestIndex, SUGGEST_FIELDS
+from modules.db_controller import Database
+from modules.competitions_controller import CompetitionStore
+from modules.ingest_controller import IngestQueue, PdfRegistry
+from modules.upload_controller import UploadWriter, UploadTooLarge
+from modules.notify_controller import ChangeFeed, COMPETITIONS_CHANNEL
+from modules.session_controller import SessionStore
+from modules.registrations_controller import RegistrationStore, EventNotFound, UserNotFound, EventClosed
+from modules.comments_controller import CommentStore, CommentNotFound, rating
+from modules.media_controller import MediaStore, InvalidImage
 
 POSTGRES_URL = os.getenv("DATABASE_URL")
-conn = psycopg2.connect(POSTGRES_URL)
-cursor = conn.cursor()
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "faiss")
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "300"))
+SEARCH_SNAPSHOT_DIR = os.getenv("SEARCH_SNAPSHOT_DIR")
+INGEST_UPLOAD_DIR = os.getenv("INGEST_UPLOAD_DIR", "/tmp")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(500 * 1024 * 1024)))
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+AUTH_HASH_WORKERS = int(os.getenv("AUTH_HASH_WORKERS", "0")) or None
+AUTH_HASH_QUEUE = int(os.getenv("AUTH_HASH_QUEUE", "64"))
+SESSION_SECRET = os.getenv("SESSION_SECRET")
+SESSION_TTL = int(os.getenv("SESSION_TTL", str(7 * 24 * 3600)))
+MEDIA_DIR = os.getenv("MEDIA_DIR", "/tmp/cmse-media")
+MEDIA_URL_PREFIX = os.getenv("MEDIA_URL_PREFIX", "/media")
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(10 * 1024 * 1024)))
+MEDIA_THUMBNAIL_SIZES = [int(size) for size in os.getenv("MEDIA_THUMBNAIL_SIZES", "64,256,1024").split(",")]
+COMMENT_MAX_IMAGES = int(os.getenv("COMMENT_MAX_IMAGES", "10"))
+# Наибольший limit /suggest; столько же популярных значений хранит каждый узел SuggestIndex
+SUGGEST_MAX_LIMIT = 50
+
+# Общий пул соединений. Обработчики, которые ходят в базу, объявлены через def, а не async def:
+# FastAPI выполняет их в пуле потоков, и синхронный psycopg2 не блокирует цикл событий
+db = Database(POSTGRES_URL, min_size=DB_POOL_MIN_SIZE, max_size=DB_POOL_MAX_SIZE, timeout=DB_POOL_TIMEOUT)
 
 app = FastAPI()
 
 
-cursor.execute("""
-        CREATE TABLE IF NOT EXISTS users (
-            id SERIAL PRIMARY KEY,
-            username VARCHAR(50) UNIQUE NOT NULL,
-            email VARCHAR(100) UNIQUE NOT NULL,
-            phone VARCHAR(20),
-            name VARCHAR(100),
-            description TEXT,
-            avatar TEXT,  -- URL или base64 изображения
-            birth DATE,
-            city VARCHAR(100),
-            sports VARCHAR(255)[],  -- Массив видов спорта
-            events INTEGER[],  -- Массив ID соревнований
-            password VARCHAR(255) NOT NULL,  -- Хешированный пароль
-            root BOOLEAN DEFAULT false,
-            admin BOOLEAN DEFAULT false,
-            created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
-            last_login TIMESTAMP WITH TIME ZONE
-        );
-
-        CREATE TABLE IF NOT EXISTS competitions (
-            id SERIAL PRIMARY KEY,
-            sport_name VARCHAR(255),
-            sport_composition VARCHAR(255),
-            ekp_number VARCHAR(255) UNIQUE,
-            date_start TIMESTAMP,
-            date_end TIMESTAMP,
-            city VARCHAR(255),
-            discipline VARCHAR(255),
-            competition_class VARCHAR(255),
-            country VARCHAR(255),
-            max_people_count INTEGER,
-            peoples INTEGER[],  -- Список ID людей
-            genders_and_ages VARCHAR[],  -- Массив для гендеров и возрастов
-            comments JSONB[]  -- Массив для комментариев в формате JSON
-        );
-
-        -- Индексы для улучшения производительности
-        CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
-        CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
-        CREATE INDEX IF NOT EXISTS idx_competitions_sport_name ON competitions(sport_name);
-        CREATE INDEX IF NOT EXISTS idx_competitions_ekp_number ON competitions(ekp_number);
-    """)
-conn.commit()
-cursor.execute("SELECT * FROM competitions")
-x = cursor.fetchall()
-print("DATA:",x)
-
-
-# Create a ThreadPoolExecutor for background tasks
-executor = ThreadPoolExecutor(max_workers=2)
-
-def parse_and_save_pdf(file_path: str):
-    try:
-        # Parse the PDF and extract data
-        pdf_parser = PDFParser()
-        parsed_data = pdf_parser.parse(file_path)
-        
-        # Insert parsed data into the PostgreSQL database
-        for entry in parsed_data:
-            sport_name, sport_composition, ekp_number, date_start, date_end, city, discipline, competition_class, country, max_people_count, genders_and_ages = entry
-            
-            # Check if the event already exists
-            cursor.execute("SELECT COUNT(*) FROM competitions WHERE ekp_number = %s", (ekp_number,))
-            exists = cursor.fetchone()[0] > 0
-            print(exists)
-            
-            if not exists:
-                cursor.execute("""
-                    INSERT INTO competitions (sport_name, sport_composition, ekp_number, date_start, date_end, city, discipline, competition_class, country, max_people_count, peoples, genders_and_ages, comments)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (sport_name, sport_composition, ekp_number, date_start, date_end, city, discipline, competition_class, country, max_people_count, [], genders_and_ages, []))
-        
-        # Commit the transaction
-        conn.commit()
+with db.connection() as schema_conn:
+    create_schema(schema_conn)
+
+# bcrypt выполняется в своём ограниченном пуле; при переполнении очереди вход и регистрация отвечают 503
+password_hasher = PasswordHasher(rounds=BCRYPT_ROUNDS, workers=AUTH_HASH_WORKERS, max_queue=AUTH_HASH_QUEUE)
+user_manager = UserManager(db, hasher=password_hasher)
+# Токены сессий: вход проверяет пароль один раз, дальше запросы проверяются по Redis
+session_store = SessionStore(REDIS_HOST, ttl=SESSION_TTL, secret=SESSION_SECRET)
+competition_store = CompetitionStore(db)
+registration_store = RegistrationStore(db)
+comment_store = CommentStore(db)
+# Аватары и картинки комментариев: в базе только хеш, файлы и уменьшенные копии раздаёт nginx из MEDIA_DIR
+media_store = MediaStore(MEDIA_DIR, sizes=MEDIA_THUMBNAIL_SIZES, url_prefix=MEDIA_URL_PREFIX)
+
+# Резидентный поисковый индекс: строится один раз при старте и дополняется при загрузке PDF
+searcher = CompetitionSearcher(db, backend=SEARCH_BACKEND)
+search_cache = SearchCache(REDIS_HOST, ttl=SEARCH_CACHE_TTL)
+# Подсказки и список видов спорта отвечают из памяти, без обращений к PostgreSQL
+suggest_index = SuggestIndex(top_size=SUGGEST_MAX_LIMIT)
+# PDF разбирает отдельный процесс worker.py; API только ставит задания в очередь
+ingest_queue = IngestQueue(REDIS_HOST)
+pdf_registry = PdfRegistry(db)
+# Изменения competitions от любых процессов приходят через LISTEN/NOTIFY и применяются к индексам в памяти
+change_feed = ChangeFeed(POSTGRES_URL)
+# Метка changed_since для догрузки изменений, пропущенных без соединения ленты
+search_index_since = None
+
+
+@app.on_event("startup")
+def build_search_index():
+    global search_index_since
+    # Метка берётся до загрузки, чтобы строки, записанные во время неё, догрузил первый resync ленты
+    _, _, search_index_since = competition_store.changed_since()
+    if SEARCH_SNAPSHOT_DIR:
+        # Рабочие процессы на одном хосте загружают общий снапшот вместо обучения TF-IDF
+        searcher.load_or_refresh(SEARCH_SNAPSHOT_DIR)
+    else:
+        searcher.refresh()
+    suggest_index.rebuild(searcher.data or [])
+    change_feed.subscribe(COMPETITIONS_CHANNEL, apply_competition_changes, resync=resync_search_index)
+    change_feed.start()
+
+
+@app.on_event("startup")
+def migrate_inline_media():
+    migrated = media_store.migrate_inline_images(db, max_bytes=MEDIA_MAX_BYTES)
+    if migrated:
+        print(f"Moved {migrated} inline images to the media store.")
+
+
+@app.on_event("shutdown")
+def close_database():
+    change_feed.stop()
+    db.close()
+
+
+def update_search_index(rows, removed):
+    """
+    Applies changed rows and removed ids to the resident search and suggest indexes.
 
-        cursor.execute("SELECT * FROM competitions")
-        x = cursor.fetchall()
-        print(x)
-        
+    The search cache generation is bumped only after this process's index has the changes: results
+    it cached from the old index before that are under an older generation and stop being read.
+    """
+    changed = searcher.add_competitions(rows)
+    suggest_index.add_competitions(changed)
+    searcher.remove_competitions(removed)
+    suggest_index.remove_competitions(removed)
+    if changed or removed:
+        search_cache.bump_generation()
+        print(f"Synced {len(changed)} changed and {len(removed)} removed competitions into the search index.")
+
+
+def apply_competition_changes(ids):
+    """Change feed handler: re-reads the notified competitions and updates the indexes."""
+    rows, removed = competition_store.fetch(ids)
+    update_search_index(rows, removed)
+
+
+def resync_search_index():
+    """
+    Catches up on changes made while the change feed was not listening: before the first connection
+    and during reconnects. Runs after LISTEN, so nothing committed later can be missed.
+    """
+    global search_index_since
+    rows, cancelled, since = competition_store.changed_since(search_index_since)
+    update_search_index(rows, cancelled)
+    search_index_since = since
+
+
+async def save_upload(chunks, upload=None):
+    """
+    Writes an upload to a unique file in INGEST_UPLOAD_DIR chunk by chunk, hashing it on the fly.
+
+    Chunks are collected up to UPLOAD_CHUNK_SIZE and written and hashed in the threadpool, so the
+    event loop never blocks on disk or SHA-256.
+
+    :param chunks: Async iterator of bytes.
+    :param upload: UploadWriter to write into instead of a new file in INGEST_UPLOAD_DIR.
+    :return: (file path, SHA-256 of the file).
+    """
+    if upload is None:
+        upload = UploadWriter(INGEST_UPLOAD_DIR, max_bytes=UPLOAD_MAX_BYTES, suffix=".pdf")
+    buffer = bytearray()
+    try:
+        async for chunk in chunks:
+            buffer += chunk
+            if len(buffer) >= UPLOAD_CHUNK_SIZE:
+                await run_in_threadpool(upload.write, buffer)
+                buffer = bytearray()
+        if buffer:
+            await run_in_threadpool(upload.write, buffer)
+        return upload.path, await run_in_threadpool(upload.close)
+    except UploadTooLarge as e:
+        await run_in_threadpool(upload.discard)
+        raise HTTPException(status_code=413, detail=str(e))
+    except BaseException:
+        await run_in_threadpool(upload.discard)
+        raise
+
+
+async def read_upload_file(file: UploadFile):
+    """Reads a multipart UploadFile in UPLOAD_CHUNK_SIZE chunks."""
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+def queue_uploaded_pdf(file_path: str, filename: str, sha256: str):
+    """Queues a saved upload for the ingest worker unless the same file has already been ingested."""
+    # An identical file has already been ingested: nothing to parse
+    file_id = pdf_registry.find_ingested(sha256)
+    if file_id is not None:
+        os.remove(file_path)
+        return {"message": "This PDF has already been ingested.", "file_id": file_id, "duplicate": True}
+
+    # Queue the file for the ingest worker process
+    try:
+        job_id = ingest_queue.enqueue(file_path, filename=filename, sha256=sha256)
     except Exception as e:
-        print(f"Error parsing PDF: {str(e)}")
-        # Handle the error (e.g., log it, notify an admin, etc.)
+        os.remove(file_path)
+        print(f"Error queueing PDF: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error queueing PDF: {str(e)}")
+
+    # Return the job id immediately; progress is available at /ingest/{job_id}
+    return {"message": "PDF upload received. Processing in the background.", "job_id": job_id}
 
 
 @app.post("/upload_pdf_db")
@@ -123,58 +225,167 @@ async def upload_pdf_db(file: UploadFile = File(...)):
     #if not file.filename.endswith('.pdf'):
     #    raise HTTPException(status_code=400, detail="Only PDF files are allowed.")
     
-    # Save the uploaded file temporarily
-    temp_file_path = f"/tmp/{file.filename}"
-    with open(temp_file_path, "wb") as temp_file:
-        temp_file.write(await file.read())
-    
-    # Start a new thread to parse the PDF and save data
-    executor.submit(parse_and_save_pdf, temp_file_path)
+    file_path, sha256 = await save_upload(read_upload_file(file))
+    return await run_in_threadpool(queue_uploaded_pdf, file_path, file.filename, sha256)
 
-    # Return a success message immediately
-    return {"message": "PDF upload received. Processing in the background."}
+
+@app.post("/upload_pdf_db/stream")
+async def upload_pdf_db_stream(request: Request, filename: str = Query("upload.pdf")):
+    """
+    Upload a PDF sent as the raw request body.
+
+    Unlike the multipart endpoint the body is not spooled by the form parser first: it goes straight
+    to the upload file as it arrives.
+    """
+    file_path, sha256 = await save_upload(request.stream())
+    return await run_in_threadpool(queue_uploaded_pdf, file_path, filename, sha256)
+
+
+@app.get("/ingest/{job_id}")
+def get_ingest_job(job_id: str):
+    """State and progress of a PDF ingestion job."""
+    job = ingest_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found.")
+    job.pop("file_path", None)
+    return job
+
+
+def format_events(results):
+    """Format (row, score) search results for output."""
+    formatted_results = []
+    for result, score in results:
+        event = dict(zip(COMPETITION_COLUMNS, result))
+        event["score"] = score
+        formatted_results.append(event)
+    return formatted_results
+
+
+def attach_ratings(event_lists):
+    """
+    Adds the current rating to formatted events in place.
+
+    Ratings change with every comment, so they are read by primary key on each response and never
+    stored in the search cache.
+
+    :param event_lists: Lists of events from format_events().
+    """
+    ratings = comment_store.ratings({event["id"] for events in event_lists for event in events})
+    for events in event_lists:
+        for event in events:
+            event["rating"] = ratings.get(event["id"], rating(0, 0))
 
 
 @app.get("/get_events")
-async def get_events(keywords: Optional[str] = Query(None)):
-    """Retrieve events based on keywords."""
-    if not keywords:
+def get_events(
+    keywords: Optional[str] = Query(None),
+    limit: int = Query(5, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    city: Optional[str] = Query(None),
+    sport: Optional[str] = Query(None),
+    composition: Optional[str] = Query(None),
+    competition_class: Optional[str] = Query(None)
+):
+    """
+    Retrieve events based on keywords.
+
+    If any structured filter is given, candidates are selected in SQL first and only they are
+    re-ranked by keywords; keywords are optional in that mode.
+    """
+    filters = {
+        "date_from": date_from,
+        "date_to": date_to,
+        "city": city,
+        "sport": sport,
+        "composition": composition,
+        "competition_class": competition_class
+    }
+    filtered = any(value is not None for value in filters.values())
+    if not keywords and not filtered:
         raise HTTPException(status_code=400, detail="No keywords provided for search.")
 
     try:
-        searcher = CompetitionSearcher(POSTGRES_URL)
-        searcher.fetch_competitions()  # Fetch competitions data from the database
-        searcher.create_feature_vectors()  # Create feature vectors
-        results = searcher.search_competitions_by_keywords(keywords)  # Search by keywords
-        searcher.close()  # Close the database connection
+        cache_params = {name: str(value) for name, value in filters.items() if value is not None}
+        cache_key, cached = search_cache.get(keywords or "", limit=limit, offset=offset, **cache_params)
+        if cached is not None:
+            attach_ratings([cached.get("events", [])])
+            return cached
+
+        if filtered:
+            results = searcher.search_filtered(filters, keywords, k=limit, offset=offset)
+        else:
+            results = searcher.search_competitions_by_keywords(keywords, k=limit, offset=offset)  # Search by keywords
 
         if not results:
-            return {"message": "No events found matching the keywords."}
-
-        # Format results for output
-        formatted_results = []
-        for result in results:
-            formatted_results.append({
-                "sport_name": result[0],
-                "sport_composition": result[1],
-                "ekp_number": result[2],
-                "date_start": result[3],
-                "date_end": result[4],
-                "city": result[5],
-                "discipline": result[6],
-                "competition_class": result[7],
-                "country": result[8],
-                "max_people_count": result[9],
-                "genders_and_ages": result[10]
-            })
-
-        return {"events": formatted_results}
+            response = {"message": "No events found matching the keywords."}
+            search_cache.set(cache_key, response)
+            return response
+
+        response = jsonable_encoder({"events": format_events(results)})
+        search_cache.set(cache_key, response)
+        attach_ratings([response["events"]])
+        return response
+
+    except Exception as e:
+        print(e)
+        raise HTTPException(status_code=500, detail=f"Error retrieving events: {str(e)}")
 
+
+class BatchSearchRequest(BaseModel):
+    queries: List[str]
+    limit: int = 5
+
+
+@app.post("/search/batch")
+def search_batch(request: BatchSearchRequest):
+    """Run many keyword searches in one call; results are returned in the order of the queries."""
+    if not request.queries:
+        raise HTTPException(status_code=400, detail="No queries provided for search.")
+    if len(request.queries) > 100 or not 1 <= request.limit <= 100:
+        raise HTTPException(status_code=400, detail="At most 100 queries and 1-100 results per query are allowed.")
+
+    try:
+        results = searcher.search_many(request.queries, k=request.limit)
+        response = jsonable_encoder({"results": [
+            {"keywords": keywords, "events": format_events(hits)}
+            for keywords, hits in zip(request.queries, results)
+        ]})
+        attach_ratings([result["events"] for result in response["results"]])
+        return response
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail=f"Error retrieving events: {str(e)}")
 
 
+@app.get("/db_stats")
+async def db_stats():
+    """Connection pool saturation metrics."""
+    return db.stats()
+
+
+@app.get("/auth_stats")
+async def auth_stats():
+    """Load of the password hashing pool."""
+    return password_hasher.stats()
+
+
+@app.get("/change_feed_stats")
+async def change_feed_stats():
+    """State of the LISTEN/NOTIFY change feed that keeps in-memory indexes in sync."""
+    return change_feed.stats()
+
+
+@app.get("/cache_stats")
+async def cache_stats():
+    """Hit/miss counters of the search result cache."""
+    try:
+        return search_cache.stats()
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching cache stats: {str(e)}")
+
+
 @app.get("/travel_info")
 async def travel_info(
     departure_city: str,
@@ -214,6 +425,13 @@ async def get_events():
     return {"message": "NO MODEL!"}
 
 
+def hasher_busy(e: HasherBusy):
+    """503 for a saturated password hashing pool: the client should retry shortly."""
+    print(f"Shedding auth request: {str(e)}")
+    return HTTPException(status_code=503, detail="Too many login attempts in progress, please retry.",
+                         headers={"Retry-After": "1"})
+
+
 @app.post("/register_user")
 async def register_user(
     username: str,
@@ -228,9 +446,12 @@ async def register_user(
     password: str
 ):
     """Register a new user."""
+    check_media(avatar)
     try:
-        user_manager = UserManager(POSTGRES_URL)
-        user_manager.register_user(
+        # Hashing runs in the bounded bcrypt pool, the insert in the regular thread pool
+        password_hash = await password_hasher.hash(password)
+        await run_in_threadpool(
+            user_manager.create_user,
             username=username,
             email=email,
             phone=phone,
@@ -241,9 +462,11 @@ async def register_user(
             city=city,
             sports=sports,
             events=[],  # New users start with no events
-            password=password
+            password_hash=password_hash
         )
         return {"message": "User  registered successfully."}
+    except HasherBusy as e:
+        raise hasher_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error registering user: {str(e)}")
 
@@ -251,112 +474,282 @@ async def register_user(
 async def auth_user(username: str, password: str):
     """Authenticate a user."""
     try:
-        user_manager = UserManager(POSTGRES_URL)
-        if user_manager.login_user(username, password):
-            return {"message": "Login successful."}
-        else:
+        user = await run_in_threadpool(user_manager.get_credentials, username)
+        if not user or not await password_hasher.verify(password, user[1]):
             raise HTTPException(status_code=401, detail="Invalid username or password.")
+
+        user_id, password_hash, admin, root = user
+        # Hashes made with another cost factor (or stored in the old bytea form) are upgraded transparently
+        if password_hasher.needs_rehash(password_hash):
+            try:
+                new_hash = await password_hasher.hash(password)
+                await run_in_threadpool(user_manager.replace_password_hash, user_id, password_hash, new_hash)
+            except HasherBusy:
+                pass  # The login itself succeeded; the hash is upgraded on a later login
+        await run_in_threadpool(user_manager.record_login, user_id)
+        token, expires_at = await run_in_threadpool(session_store.issue, user_id, username, admin, root)
+        return {"message": "Login successful.", "token": token, "token_type": "bearer", "expires_at": expires_at,
+                "user_id": user_id}
+    except HTTPException:
+        raise
+    except HasherBusy as e:
+        raise hasher_busy(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error logging in: {str(e)}")
 
+def current_user(authorization: Optional[str] = Header(None)):
+    """
+    Session of the request's bearer token.
+
+    The signature and expiry are checked locally and the session itself is one Redis lookup;
+    neither Postgres nor bcrypt is involved.
+    """
+    if not authorization or not authorization.lower().startswith("bearer "):
+        raise HTTPException(status_code=401, detail="Missing session token.", headers={"WWW-Authenticate": "Bearer"})
+    try:
+        session = session_store.validate(authorization[len("bearer "):].strip())
+    except redis.RedisError as e:
+        print(f"Error validating session: {str(e)}")
+        raise HTTPException(status_code=503, detail="Session store unavailable.")
+    if session is None:
+        raise HTTPException(status_code=401, detail="Invalid or expired session token.",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return session
+
+
+def require_user(session: dict, user_id: int):
+    """Only the user themselves or an admin may act on behalf of user_id."""
+    if session["user_id"] != user_id and not (session["admin"] or session["root"]):
+        raise HTTPException(status_code=403, detail="Not allowed to act for this user.")
+
+
+@app.post("/logout")
+def logout(session: dict = Depends(current_user)):
+    """Revoke the current session token."""
+    session_store.revoke(session)
+    return {"message": "Logged out."}
+
+
+@app.get("/me")
+def me(session: dict = Depends(current_user)):
+    """The user of the current session."""
+    return {key: session[key] for key in ("user_id", "username", "admin", "root", "expires_at")}
+
+
+@app.post("/media")
+async def upload_media(file: UploadFile = File(...), session: dict = Depends(current_user)):
+    """
+    Upload an image (JPEG, PNG, WebP or GIF) for an avatar or a comment.
+
+    The image is stored once by its content hash with thumbnails of MEDIA_THUMBNAIL_SIZES; the returned
+    hash is what avatar and comment images should be set to.
+    """
+    file_path, sha256 = await save_upload(read_upload_file(file), media_store.upload(MEDIA_MAX_BYTES))
+    try:
+        media_hash = await run_in_threadpool(media_store.put, file_path, sha256)
+    except InvalidImage as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except Exception as e:
+        print(f"Error storing image: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error storing image: {str(e)}")
+    return {"media": media_hash, "urls": media_store.urls(media_hash)}
+
+
+def check_media(*values):
+    """Avatars and comment images must be uploaded to /media first (or be external http(s) URLs)."""
+    for value in values:
+        if value and not media_store.is_reference(value):
+            raise HTTPException(status_code=400,
+                                detail="Images must be a hash returned by /media or an http(s) URL.")
+
+
+@app.get("/users")
+def find_users(
+    city: Optional[str] = Query(None),
+    sports: Optional[List[str]] = Query(None),
+    sports_match: str = Query("all", regex="^(all|any)$"),
+    events: Optional[List[int]] = Query(None),
+    events_match: str = Query("all", regex="^(all|any)$"),
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[int] = Query(None, description="next_cursor of the previous page."),
+    session: dict = Depends(current_user)
+):
+    """
+    Find users by city, sports (all or any of them) and events they are registered for.
+
+    Results are ordered by user id and paged by cursor.
+    """
+    if len(sports or []) > 50 or len(events or []) > 50:
+        raise HTTPException(status_code=400, detail="At most 50 sports and 50 events are allowed.")
+    try:
+        users, next_cursor = user_manager.find_users(
+            city=city,
+            sports_all=sports if sports_match == "all" else None,
+            sports_any=sports if sports_match == "any" else None,
+            events_all=events if events_match == "all" else None,
+            events_any=events if events_match == "any" else None,
+            limit=limit,
+            after=cursor
+        )
+    except Exception as e:
+        print(f"Error finding users: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error finding users: {str(e)}")
+    for user in users:
+        user["avatar_urls"] = media_store.urls(user["avatar"])
+    return {"users": users, "next_cursor": next_cursor}
+
+
 @app.put("/edit_user/{user_id}")
-async def edit_user(user_id: int, user_data: Dict):
+def edit_user(user_id: int, user_data: Dict, session: dict = Depends(current_user)):
     """Edit user details."""
+    require_user(session, user_id)
+    if ("admin" in user_data or "root" in user_data) and not (session["admin"] or session["root"]):
+        raise HTTPException(status_code=403, detail="Only admins can change admin or root flags.")
+    check_media(user_data.get("avatar"))
     try:
-        user_manager = UserManager(POSTGRES_URL)
         user_manager.edit_user(user_id, **user_data)
+        # Sessions keep the flags and username they were issued with, so they have to be reissued
+        if "admin" in user_data or "root" in user_data or "username" in user_data:
+            session_store.revoke_user(user_id)
         return {"message": "User  updated successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error updating user: {str(e)}")
 
 @app.delete("/delete_user/{user_id}")
-async def delete_user(user_id: int):
+def delete_user(user_id: int, session: dict = Depends(current_user)):
     """Delete a user."""
+    require_user(session, user_id)
     try:
-        user_manager = UserManager(POSTGRES_URL)
         user_manager.delete_user(user_id)
+        session_store.revoke_user(user_id)
         return {"message": "User  deleted successfully."}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error deleting user: {str(e)}")
 
 @app.post("/register_for_event/{event_id}/{user_id}")
-async def register_for_event(event_id: int, user_id: int):
-    """Register a user for an event if not full."""
+def register_for_event(event_id: int, user_id: int, session: dict = Depends(current_user)):
+    """Register a user for an event; if it is full, the user is put on the waitlist."""
+    require_user(session, user_id)
     try:
-        user_manager = UserManager(POSTGRES_URL)
-        
-        # Check if the event exists
-        cursor.execute("SELECT max_people_count, peoples FROM competitions WHERE id = %s", (event_id,))
-        event = cursor.fetchone()
-        
-        if not event:
-            raise HTTPException(status_code=404, detail="Event not found.")
-        
-        max_people_count, peoples = event
-        
-        # Check if the event is full
-        if len(peoples) >= max_people_count:
-            raise HTTPException(status_code=400, detail="Event is full.")
-        
-        # Register user for the event
-        peoples.append(user_id)  # Add user ID to the event's peoples list
-        cursor.execute("UPDATE competitions SET peoples = %s WHERE id = %s", (peoples, event_id))
-        
-        # Add event ID to the user's events list
-        cursor.execute("UPDATE users SET events = array_append(events, %s) WHERE id = %s", (event_id, user_id))
-        
-        conn.commit()  # Commit the changes
-        return {"message": "User  registered for the event successfully."}
+        status, created = registration_store.register(event_id, user_id)
+        response = {"status": status}
+        if status == "registered":
+            response["message"] = ("User  registered for the event successfully." if created
+                                   else "User is already registered for the event.")
+        else:
+            response["message"] = ("Event is full; user added to the waitlist." if created
+                                   else "User is already on the waitlist.")
+            response["waitlist_position"] = registration_store.waitlist_position(event_id, user_id)
+        return response
+    except (EventNotFound, UserNotFound) as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except EventClosed as e:
+        raise HTTPException(status_code=409, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error registering for event: {str(e)}")
 
+@app.delete("/register_for_event/{event_id}/{user_id}")
+def unregister_from_event(event_id: int, user_id: int, session: dict = Depends(current_user)):
+    """Cancel a registration or leave the waitlist; a freed seat goes to the first user on the waitlist."""
+    require_user(session, user_id)
+    try:
+        status, promoted = registration_store.unregister(event_id, user_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error cancelling registration: {str(e)}")
+    if status is None:
+        raise HTTPException(status_code=404, detail="Registration not found.")
+    return {"message": "Registration cancelled.", "previous_status": status, "promoted_user_id": promoted}
+
+@app.get("/event_registrations/{event_id}")
+def event_registrations(event_id: int):
+    """Capacity, registered and waitlisted counts of an event."""
+    try:
+        summary = registration_store.summary(event_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching registrations: {str(e)}")
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Event not found.")
+    return summary
+
 @app.get("/get_sport_names")
 async def get_sport_names() -> Dict[str, List[str]]:
     """Retrieve all unique sport names from the competitions."""
     try:
-        cursor.execute("SELECT DISTINCT sport_name FROM competitions")
-        sport_names = cursor.fetchall()
-        
-        # Extract sport names from the fetched results
-        unique_sport_names = [sport[0] for sport in sport_names]
-
-        return {"sport_names": unique_sport_names}
+        return {"sport_names": suggest_index.values("sport_name")}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching sport names: {str(e)}")
 
+@app.get("/suggest")
+async def suggest(
+    q: str,
+    field: Optional[str] = Query(None),
+    limit: int = Query(10, ge=1, le=SUGGEST_MAX_LIMIT)
+):
+    """Autocomplete sport names, cities, disciplines and competition classes by prefix, tolerating typos."""
+    if field is not None and field not in SUGGEST_FIELDS:
+        raise HTTPException(status_code=400, detail=f"Field must be one of: {', '.join(SUGGEST_FIELDS)}.")
+    return {"suggestions": suggest_index.suggest(q, field=field, limit=limit)}
+
 @app.post("/comment_event/{event_id}/{user_id}")
-async def comment_event(
+def comment_event(
     event_id: int,
     user_id: int,
     rate: int,
     text: str,
-    images: List[str] = []
+    images: List[str] = [],
+    session: dict = Depends(current_user)
 ):
-    """Submit a comment for an event."""
+    """Submit a comment for an event; its rate is added to the event rating."""
+    require_user(session, user_id)
+    # Validate the rate
+    if rate < 0 or rate > 5:
+        raise HTTPException(status_code=400, detail="Rate must be between 0 and 5.")
+    if len(images) > COMMENT_MAX_IMAGES:
+        raise HTTPException(status_code=400, detail=f"At most {COMMENT_MAX_IMAGES} images per comment.")
+    check_media(*images)
     try:
-        # Validate the rate
-        if rate < 0 or rate > 5:
-            raise HTTPException(status_code=400, detail="Rate must be between 0 and 5.")
-
-        # Create the comment structure
-        comment = {
-            "user_id": user_id,
-            "rate": rate,
-            "text": text,
-            "images": images
-        }
-
-        # Insert the comment into the event's comments array
-        cursor.execute("""
-            UPDATE competitions 
-            SET comments = array_append(comments, %s) 
-            WHERE id = %s
-        """, (comment, event_id))
-        
-        conn.commit()  # Commit the changes
-        return {"message": "Comment submitted successfully."}
+        comment = comment_store.add(event_id, user_id, rate, text, images)
+    except (EventNotFound, UserNotFound) as e:
+        raise HTTPException(status_code=404, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error submitting comment: {str(e)}")
+    return {"message": "Comment submitted successfully.", "comment": jsonable_encoder(comment)}
+
+@app.delete("/events/{event_id}/comments/{comment_id}")
+def delete_comment(event_id: int, comment_id: int, session: dict = Depends(current_user)):
+    """Delete a comment; only its author or an admin may do it."""
+    comment = comment_store.get(comment_id)
+    if comment is None or comment["competition_id"] != event_id:
+        raise HTTPException(status_code=404, detail="Comment not found.")
+    if comment["user_id"] != session["user_id"] and not (session["admin"] or session["root"]):
+        raise HTTPException(status_code=403, detail="Not allowed to delete this comment.")
+    try:
+        comment_store.delete(event_id, comment_id)
+    except CommentNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error deleting comment: {str(e)}")
+    return {"message": "Comment deleted successfully."}
+
+@app.get("/events/{event_id}/comments")
+def event_comments(
+    event_id: int,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[int] = Query(None, description="next_cursor of the previous page.")
+):
+    """Comments of an event, newest first, with the event rating; pages are keyed by comment id."""
+    try:
+        ratings = comment_store.ratings([event_id])
+        if event_id not in ratings:
+            raise HTTPException(status_code=404, detail="Event not found.")
+        comments, next_cursor = comment_store.page(event_id, limit=limit, before=cursor)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error fetching comments: {str(e)}")
+    for comment in comments:
+        comment["image_urls"] = [media_store.urls(image) for image in comment["images"]]
+    return jsonable_encoder({"rating": ratings[event_id], "comments": comments, "next_cursor": next_cursor})
 
 @app.get("/")
 async def root() -> Dict[str, str]:
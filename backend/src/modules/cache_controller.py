@@ -0,0 +1,82 @@
+import hashlib
+import json
+import redis
+
+
+class SearchCache:
+    GENERATION_KEY = "search:generation"
+    HITS_KEY = "search:cache:hits"
+    MISSES_KEY = "search:cache:misses"
+
+    def __init__(self, host, port=6379, ttl=300):
+        """
+        Кэш результатов поиска в Redis.
+
+        Ключ включает номер поколения данных. Поколение увеличивает каждый процесс API после того, как
+        применил изменения соревнований к своему индексу в памяти (а не исполнитель загрузки сразу после
+        COMMIT): старые записи просто перестают читаться, пока не истечёт их TTL.
+
+        :param host: Хост Redis.
+        :param port: Порт Redis (по умолчанию 6379).
+        :param ttl: Время жизни записи в секундах (по умолчанию 300).
+        """
+        self.redis = redis.Redis(host=host, port=port, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.ttl = ttl
+
+    @staticmethod
+    def normalize_keywords(keywords_str):
+        """Приводит запрос к каноническому виду: регистр, пробелы и порядок слов через запятую не важны."""
+        keywords = [" ".join(keyword.lower().split()) for keyword in keywords_str.split(',')]
+        return ",".join(sorted(keyword for keyword in keywords if keyword))
+
+    def generation(self):
+        return int(self.redis.get(self.GENERATION_KEY) or 0)
+
+    def bump_generation(self):
+        """Инвалидирует все закэшированные результаты, увеличивая поколение данных."""
+        try:
+            return self.redis.incr(self.GENERATION_KEY)
+        except redis.RedisError as e:
+            print(f"Error bumping search cache generation: {str(e)}")
+            return None
+
+    def _key(self, generation, keywords_str, **params):
+        payload = json.dumps([self.normalize_keywords(keywords_str), params], sort_keys=True, ensure_ascii=False)
+        return f"search:{generation}:{hashlib.sha1(payload.encode('utf-8')).hexdigest()}"
+
+    def get(self, keywords_str, **params):
+        """
+        :return: (ключ, закэшированный ответ или None). Ошибки Redis считаются промахом.
+
+        Ключ нужно передать в set(): он привязан к поколению, прочитанному до поиска. Результат,
+        посчитанный процессом по индексу без последних изменений, может попасть в текущее поколение,
+        но этот процесс увеличит поколение, когда применит изменения, и запись перестанет читаться.
+        """
+        try:
+            key = self._key(self.generation(), keywords_str, **params)
+            cached = self.redis.get(key)
+            self.redis.incr(self.HITS_KEY if cached is not None else self.MISSES_KEY)
+        except redis.RedisError as e:
+            print(f"Error reading search cache: {str(e)}")
+            return None, None
+        return key, json.loads(cached) if cached is not None else None
+
+    def set(self, key, value):
+        """:param value: JSON-сериализуемый ответ."""
+        if key is None:
+            return
+        try:
+            self.redis.set(key, json.dumps(value, ensure_ascii=False), ex=self.ttl)
+        except redis.RedisError as e:
+            print(f"Error writing search cache: {str(e)}")
+
+    def stats(self):
+        hits, misses, generation = self.redis.mget(self.HITS_KEY, self.MISSES_KEY, self.GENERATION_KEY)
+        hits, misses = int(hits or 0), int(misses or 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": hits / (hits + misses) if hits + misses else 0.0,
+            "generation": int(generation or 0),
+            "used_memory": self.redis.info("memory").get("used_memory_human"),
+        }
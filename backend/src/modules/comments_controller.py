@@ -0,0 +1,115 @@
+import psycopg2.errors
+
+from modules.registrations_controller import EventNotFound, UserNotFound
+
+COMMENT_COLUMNS = ["id", "competition_id", "user_id", "rate", "text", "images", "created_at"]
+
+
+class CommentNotFound(LookupError):
+    """Комментария с таким id у соревнования нет."""
+
+
+def rating(count, total):
+    """:return: {"count", "sum", "average"} для счётчиков competitions.rating_count и rating_sum."""
+    return {"count": count, "sum": total, "average": round(total / count, 2) if count else None}
+
+
+class CommentStore:
+    def __init__(self, db):
+        """
+        Комментарии к соревнованиям и их рейтинг.
+
+        Каждый комментарий - отдельная строка event_comments, поэтому новый комментарий не переписывает
+        строку соревнования со всеми предыдущими. Рейтинг хранится счётчиками competitions.rating_count и
+        rating_sum, которые меняются в той же транзакции, что и комментарий: списку соревнований не нужно
+        агрегировать комментарии.
+
+        :param db: Пул соединений Database.
+        """
+        self.db = db
+
+    def add(self, competition_id, user_id, rate, text, images=()):
+        """
+        Добавляет комментарий и учитывает его оценку в рейтинге соревнования.
+
+        :return: Комментарий (словарь по COMMENT_COLUMNS).
+        :raises EventNotFound, UserNotFound:
+        """
+        with self.db.cursor() as cursor:
+            try:
+                cursor.execute(f"""
+                    INSERT INTO event_comments (competition_id, user_id, rate, text, images)
+                    VALUES (%s, %s, %s, %s, %s)
+                    RETURNING {", ".join(COMMENT_COLUMNS)}
+                """, (competition_id, user_id, rate, text, list(images)))
+            except psycopg2.errors.ForeignKeyViolation as e:
+                if e.diag.constraint_name and "user_id" in e.diag.constraint_name:
+                    raise UserNotFound(f"User {user_id} not found.")
+                raise EventNotFound(f"Event {competition_id} not found.")
+            comment = dict(zip(COMMENT_COLUMNS, cursor.fetchone()))
+            # Строка соревнования блокируется последним оператором - до COMMIT
+            cursor.execute("""
+                UPDATE competitions SET rating_count = rating_count + 1, rating_sum = rating_sum + %s
+                WHERE id = %s
+            """, (rate, competition_id))
+        return comment
+
+    def delete(self, competition_id, comment_id):
+        """
+        Удаляет комментарий и вычитает его оценку из рейтинга.
+
+        :return: Удалённый комментарий.
+        :raises CommentNotFound:
+        """
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                DELETE FROM event_comments WHERE id = %s AND competition_id = %s
+                RETURNING {", ".join(COMMENT_COLUMNS)}
+            """, (comment_id, competition_id))
+            row = cursor.fetchone()
+            if row is None:
+                raise CommentNotFound(f"Comment {comment_id} not found.")
+            comment = dict(zip(COMMENT_COLUMNS, row))
+            cursor.execute("""
+                UPDATE competitions SET rating_count = rating_count - 1, rating_sum = rating_sum - %s
+                WHERE id = %s
+            """, (comment["rate"], competition_id))
+        return comment
+
+    def get(self, comment_id):
+        """:return: Комментарий или None."""
+        with self.db.cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(COMMENT_COLUMNS)} FROM event_comments WHERE id = %s", (comment_id,))
+            row = cursor.fetchone()
+        return dict(zip(COMMENT_COLUMNS, row)) if row else None
+
+    def page(self, competition_id, limit=20, before=None):
+        """
+        Страница комментариев от новых к старым.
+
+        Пагинация по ключу: следующая страница начинается после последнего id предыдущей, поэтому
+        запрос читает limit строк индекса (competition_id, id) независимо от глубины, а новые
+        комментарии не сдвигают уже выданные страницы.
+
+        :param before: Курсор - id последнего комментария предыдущей страницы.
+        :return: (комментарии, курсор следующей страницы или None).
+        """
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {", ".join(COMMENT_COLUMNS)} FROM event_comments
+                WHERE competition_id = %s AND (%s::BIGINT IS NULL OR id < %s)
+                ORDER BY id DESC
+                LIMIT %s
+            """, (competition_id, before, before, limit + 1))
+            rows = cursor.fetchall()
+        comments = [dict(zip(COMMENT_COLUMNS, row)) for row in rows[:limit]]
+        return comments, (comments[-1]["id"] if len(rows) > limit else None)
+
+    def ratings(self, competition_ids):
+        """:return: {id соревнования: rating()} одним запросом по первичному ключу."""
+        if not competition_ids:
+            return {}
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT id, rating_count, rating_sum FROM competitions WHERE id = ANY(%s)",
+                           (list(competition_ids),))
+            return {row[0]: rating(row[1], row[2]) for row in cursor.fetchall()}
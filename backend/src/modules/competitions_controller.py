@@ -0,0 +1,147 @@
+from datetime import datetime
+from psycopg2.extras import execute_values
+from modules.rag_controller import COMPETITION_COLUMNS
+
+# Поля, которые приходят из PDFParser, в порядке его кортежей
+PARSED_COLUMNS = ("sport_name", "sport_composition", "ekp_number", "date_start", "date_end", "city", "discipline",
+                  "competition_class", "country", "max_people_count", "genders_and_ages")
+DATE_FORMATS = ("%d.%m.%Y", "%Y-%m-%d")
+
+
+def parse_date(value):
+    """Дата из календаря ЕКП (ДД.ММ.ГГГГ) или ISO; нераспознанная дата - None, а не ошибка всей пачки."""
+    value = str(value or "").strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_int(value):
+    value = str(value or "").strip()
+    return int(value) if value.isdigit() else None
+
+
+class CompetitionStore:
+    def __init__(self, db):
+        """
+        Запись соревнований из календаря ЕКП в PostgreSQL.
+
+        :param db: Пул соединений Database.
+        """
+        self.db = db
+
+    @staticmethod
+    def prepare_row(entry):
+        """Приводит кортеж PDFParser к типам колонок таблицы competitions."""
+        (sport_name, sport_composition, ekp_number, date_start, date_end, city, discipline,
+         competition_class, country, max_people_count, genders_and_ages) = entry
+        return (sport_name, sport_composition, ekp_number, parse_date(date_start), parse_date(date_end), city,
+                discipline, competition_class, country, parse_int(max_people_count),
+                [genders_and_ages] if genders_and_ages else [])
+
+    def upsert(self, entries, page_size=1000):
+        """
+        Добавляет новые соревнования и обновляет изменившиеся одним INSERT ... ON CONFLICT (ekp_number)
+        в одной транзакции.
+
+        Строки, которые не изменились, не перезаписываются и не возвращаются; отменённое соревнование,
+        вернувшееся в календарь, снова становится активным.
+
+        :param entries: Кортежи в формате PDFParser.parse.
+        :param page_size: Сколько строк отправлять в одном операторе.
+        :return: (inserted, updated) - списки строк в порядке COMPETITION_COLUMNS.
+        """
+        # ON CONFLICT не может изменить одну строку дважды за оператор: оставляем последнюю версию номера
+        rows = {}
+        for entry in entries:
+            row = self.prepare_row(entry)
+            if row[2]:
+                rows[row[2]] = row
+        if not rows:
+            return [], []
+
+        updatable = [column for column in PARSED_COLUMNS if column != "ekp_number"]
+        query = f"""
+            INSERT INTO competitions ({", ".join(PARSED_COLUMNS)}, peoples, comments)
+            VALUES %s
+            ON CONFLICT (ekp_number) DO UPDATE SET
+                {", ".join(f"{column} = EXCLUDED.{column}" for column in updatable)},
+                cancelled = false,
+                updated_at = now()
+            WHERE ({", ".join(f"competitions.{column}" for column in updatable)}, competitions.cancelled)
+                IS DISTINCT FROM ({", ".join(f"EXCLUDED.{column}" for column in updatable)}, false)
+            RETURNING {", ".join(COMPETITION_COLUMNS)}, (xmax = 0) AS inserted
+        """
+        template = "(" + ", ".join(["%s"] * len(PARSED_COLUMNS)) + ", '{}', '{}')"
+
+        with self.db.cursor() as cursor:
+            results = execute_values(cursor, query, list(rows.values()), template=template,
+                                     page_size=page_size, fetch=True)
+
+        inserted = [tuple(result[:-1]) for result in results if result[-1]]
+        updated = [tuple(result[:-1]) for result in results if not result[-1]]
+        return inserted, updated
+
+    def cancel(self, ekp_numbers):
+        """
+        Помечает соревнования отменёнными, если они ещё не помечены.
+
+        :return: id отменённых соревнований.
+        """
+        if not ekp_numbers:
+            return []
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                UPDATE competitions SET cancelled = true, updated_at = now()
+                WHERE ekp_number = ANY(%s) AND NOT cancelled
+                RETURNING id
+            """, (list(ekp_numbers),))
+            return [row[0] for row in cursor.fetchall()]
+
+    def fetch(self, ids):
+        """
+        Текущее состояние соревнований по id, например из уведомления ленты изменений.
+
+        :return: (активные строки в порядке COMPETITION_COLUMNS, id отменённых или удалённых).
+        """
+        if not ids:
+            return [], []
+        with self.db.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT {", ".join(COMPETITION_COLUMNS)} FROM competitions
+                WHERE id = ANY(%s) AND NOT cancelled
+                ORDER BY id
+            """, (list(ids),))
+            active = [tuple(row) for row in cursor.fetchall()]
+        found = {row[0] for row in active}
+        return active, [id_ for id_ in ids if id_ not in found]
+
+    def changed_since(self, since=None, overlap=60):
+        """
+        Строки, добавленные, изменённые или отменённые после метки since.
+
+        updated_at - время начала транзакции, которая записала строку, поэтому транзакция, начатая до since,
+        но зафиксированная позже, иначе была бы пропущена; окно overlap секунд это покрывает. Строки из
+        окна могут вернуться повторно, получатель должен это допускать.
+
+        :param since: Метка из предыдущего вызова; None - только получить текущую метку.
+        :param overlap: Перекрытие окон в секундах (по умолчанию 60).
+        :return: (активные строки в порядке COMPETITION_COLUMNS, id отменённых, метка для следующего вызова).
+        """
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT now()")
+            now = cursor.fetchone()[0]
+            if since is None:
+                return [], [], now
+            cursor.execute(f"""
+                SELECT {", ".join(COMPETITION_COLUMNS)}, cancelled FROM competitions
+                WHERE updated_at >= %s - make_interval(secs => %s)
+                ORDER BY id
+            """, (since, overlap))
+            rows = cursor.fetchall()
+        active = [tuple(row[:-1]) for row in rows if not row[-1]]
+        cancelled = [row[0] for row in rows if row[-1]]
+        return active, cancelled, now
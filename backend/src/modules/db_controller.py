@@ -0,0 +1,125 @@
+import threading
+import time
+import weakref
+from contextlib import contextmanager
+from psycopg2.pool import ThreadedConnectionPool
+
+
+class PoolTimeout(Exception):
+    """Свободное соединение не появилось за отведённое время."""
+
+
+class Database:
+    def __init__(self, db_url, min_size=1, max_size=10, timeout=30.0):
+        """
+        Пул соединений PostgreSQL, общий для всех обработчиков и фоновых задач.
+
+        ThreadedConnectionPool при исчерпании сразу бросает ошибку, поэтому перед ним стоит
+        семафор: лишние запросы ждут освобождения соединения не дольше timeout секунд.
+
+        :param db_url: Строка подключения к PostgreSQL.
+        :param min_size: Сколько соединений открыть заранее (по умолчанию 1).
+        :param max_size: Максимальный размер пула (по умолчанию 10).
+        :param timeout: Сколько ждать свободного соединения, в секундах (по умолчанию 30).
+        """
+        self.pool = ThreadedConnectionPool(min_size, max_size, db_url)
+        self.max_size = max_size
+        self.timeout = timeout
+        self.slots = threading.BoundedSemaphore(max_size)
+        self.metrics_lock = threading.Lock()
+        self.in_use = 0
+        self.waiting = 0
+        self.acquired = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        # Имена операторов, подготовленных на каждом соединении; закрытые соединения выпадают сами
+        self.prepared = weakref.WeakKeyDictionary()
+        self.prepared_lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """
+        Выдаёт соединение на время одной транзакции: commit при успехе, rollback при ошибке.
+        """
+        started = time.perf_counter()
+        with self.metrics_lock:
+            self.waiting += 1
+        acquired = self.slots.acquire(timeout=self.timeout)
+        waited = time.perf_counter() - started
+        with self.metrics_lock:
+            self.waiting -= 1
+            if acquired:
+                self.in_use += 1
+                self.acquired += 1
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            else:
+                self.timeouts += 1
+        if not acquired:
+            raise PoolTimeout(f"No database connection available after {self.timeout} seconds.")
+
+        conn = None
+        try:
+            conn = self.pool.getconn()
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        finally:
+            if conn is not None:
+                # Разорванное соединение не возвращаем в пул
+                self.pool.putconn(conn, close=bool(conn.closed))
+            with self.metrics_lock:
+                self.in_use -= 1
+            self.slots.release()
+
+    @contextmanager
+    def cursor(self):
+        """Курсор в отдельной транзакции."""
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                yield cursor
+
+    def execute_prepared(self, cursor, name, statement, types, params):
+        """
+        Выполняет оператор, подготовленный на сервере (PREPARE) один раз для соединения курсора.
+
+        Подготовленный оператор разбирается и анализируется один раз, а его план PostgreSQL может
+        переиспользовать между вызовами. PREPARE не откатывается вместе с транзакцией, поэтому
+        достаточно помнить, на каких соединениях он уже выполнен.
+
+        :param name: Имя оператора; одно имя - один текст statement.
+        :param statement: SQL с параметрами $1, $2, ...
+        :param types: Типы параметров PostgreSQL, по одному на параметр.
+        :param params: Значения параметров.
+        """
+        with self.prepared_lock:
+            names = self.prepared.setdefault(cursor.connection, set())
+            ready = name in names
+        if not ready:
+            cursor.execute(f"PREPARE {name} ({', '.join(types)}) AS {statement}")
+            with self.prepared_lock:
+                names.add(name)
+        cursor.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))})", params)
+
+    def stats(self):
+        """Метрики насыщения пула."""
+        with self.metrics_lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "waiting": self.waiting,
+                "utilization": self.in_use / self.max_size,
+                "acquired_total": self.acquired,
+                "timeouts_total": self.timeouts,
+                "avg_wait_ms": self.wait_seconds / self.acquired * 1000 if self.acquired else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
+
+    def close(self):
+        self.pool.closeall()
+
@@ -0,0 +1,270 @@
+import os
+import time
+import uuid
+from itertools import islice
+import redis
+from psycopg2.extras import execute_values
+from modules.pdf_parser import PDFParser, file_sha256
+
+JOB_STATES = ("queued", "running", "done", "failed")
+JOB_COUNTERS = ("attempts", "pages_parsed", "pages_reused", "rows_parsed", "rows_inserted", "rows_updated",
+                "rows_skipped", "rows_cancelled")
+
+
+class PdfRegistry:
+    def __init__(self, db):
+        """
+        Учёт загруженных PDF: хеш файла, хеши страниц и разобранные строки страниц.
+
+        Повторная загрузка того же файла пропускается целиком, а в новой редакции календаря заново
+        разбираются только страницы, чьих хешей ещё нет в pdf_page_lines. Методы lookup() и store()
+        реализуют кэш страниц для PDFParser.iter_parse.
+
+        :param db: Пул соединений Database.
+        """
+        self.db = db
+
+    def find_ingested(self, sha256):
+        """:return: id уже полностью загруженного файла с таким хешем или None."""
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT id FROM pdf_files WHERE sha256 = %s AND ingested_at IS NOT NULL", (sha256,))
+            row = cursor.fetchone()
+        return row[0] if row else None
+
+    def register(self, sha256, filename, page_hashes):
+        """
+        Запоминает файл и хеши его страниц.
+
+        :return: id файла.
+        """
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO pdf_files (sha256, filename, page_count) VALUES (%s, %s, %s)
+                ON CONFLICT (sha256) DO UPDATE SET filename = EXCLUDED.filename
+                RETURNING id
+            """, (sha256, filename, len(page_hashes)))
+            file_id = cursor.fetchone()[0]
+            cursor.execute("DELETE FROM pdf_pages WHERE file_id = %s", (file_id,))
+            execute_values(cursor, "INSERT INTO pdf_pages (file_id, page_number, page_hash) VALUES %s",
+                           [(file_id, number, page_hash) for number, page_hash in enumerate(page_hashes)])
+        return file_id
+
+    def previous_revision(self, file_id, min_overlap=0.5):
+        """
+        Предыдущая редакция того же календаря: загруженный файл, с которым больше всего общих страниц.
+
+        Одна-две общие страницы (обложка, титульный лист) ещё не делают файл редакцией: по ней
+        отменяются соревнования, которых нет в новом файле, поэтому общих страниц должно быть больше
+        min_overlap от числа страниц каждого из двух файлов.
+
+        :param min_overlap: Минимальная доля общих страниц (по умолчанию больше половины).
+        :return: (id файла, номера ЕКП в нём) или None.
+        """
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT files.id, files.ekp_numbers
+                FROM pdf_files current_file
+                JOIN pdf_pages current ON current.file_id = current_file.id
+                JOIN pdf_pages other ON other.page_hash = current.page_hash AND other.file_id <> current.file_id
+                JOIN pdf_files files ON files.id = other.file_id
+                WHERE current_file.id = %(file_id)s AND files.ingested_at IS NOT NULL
+                GROUP BY files.id, current_file.page_count
+                HAVING count(DISTINCT current.page_number) > %(min_overlap)s * current_file.page_count
+                   AND count(DISTINCT other.page_number) > %(min_overlap)s * files.page_count
+                ORDER BY count(DISTINCT current.page_number) DESC, files.ingested_at DESC
+                LIMIT 1
+            """, {"file_id": file_id, "min_overlap": min_overlap})
+            row = cursor.fetchone()
+        return (row[0], row[1] or []) if row else None
+
+    def complete(self, file_id, ekp_numbers):
+        with self.db.cursor() as cursor:
+            cursor.execute("UPDATE pdf_files SET ekp_numbers = %s, ingested_at = now() WHERE id = %s",
+                           (sorted(ekp_numbers), file_id))
+
+    def lookup(self, layout_key, page_hashes):
+        """:return: Словарь хеш страницы -> (строки, названия видов спорта) для уже разобранных страниц."""
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT page_hash, lines, sport_names FROM pdf_page_lines
+                WHERE layout_key = %s AND page_hash = ANY(%s)
+            """, (layout_key, list(set(page_hashes))))
+            return {page_hash: (lines, sport_names) for page_hash, lines, sport_names in cursor.fetchall()}
+
+    def store(self, layout_key, page_hash, result):
+        lines, sport_names = result
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO pdf_page_lines (page_hash, layout_key, lines, sport_names) VALUES (%s, %s, %s, %s)
+                ON CONFLICT (page_hash, layout_key) DO NOTHING
+            """, (page_hash, layout_key, lines, sport_names))
+
+
+class IngestQueue:
+    QUEUE_KEY = "ingest:queue"
+    JOB_KEY = "ingest:job:{}"
+    PROCESSING_KEY = "ingest:processing:{}"
+
+    def __init__(self, host, port=6379, job_ttl=7 * 24 * 3600, max_attempts=3):
+        """
+        Очередь заданий на загрузку PDF в Redis.
+
+        Задание - хеш ingest:job:<id> с состоянием и счётчиками прогресса; в очередь кладётся только id.
+        Исполнитель забирает id атомарно в свой список processing, поэтому задание, прерванное
+        падением или перезапуском исполнителя, не теряется: при старте он возвращает его в очередь.
+
+        :param host: Хост Redis.
+        :param port: Порт Redis (по умолчанию 6379).
+        :param job_ttl: Сколько хранить завершённые задания, в секундах (по умолчанию неделя).
+        :param max_attempts: После стольких прерванных попыток задание считается упавшим.
+        """
+        self.redis = redis.Redis(host=host, port=port, decode_responses=True)
+        self.job_ttl = job_ttl
+        self.max_attempts = max_attempts
+
+    def enqueue(self, file_path, filename=None, job_id=None, sha256=""):
+        """
+        Ставит файл в очередь на разбор.
+
+        :param sha256: Хеш файла, если он уже посчитан при приёме.
+        :return: id задания.
+        """
+        job_id = job_id or uuid.uuid4().hex
+        job = {
+            "id": job_id,
+            "state": "queued",
+            "file_path": file_path,
+            "filename": filename or os.path.basename(file_path),
+            "sha256": sha256,
+            "created_at": time.time(),
+            "error": "",
+        }
+        job.update(dict.fromkeys(JOB_COUNTERS, 0))
+        with self.redis.pipeline() as pipe:
+            pipe.hset(self.JOB_KEY.format(job_id), mapping=job)
+            pipe.lpush(self.QUEUE_KEY, job_id)
+            pipe.execute()
+        return job_id
+
+    def get(self, job_id):
+        """:return: Состояние задания или None, если такого нет."""
+        job = self.redis.hgetall(self.JOB_KEY.format(job_id))
+        if not job:
+            return None
+        for field in JOB_COUNTERS:
+            job[field] = int(job.get(field) or 0)
+        for field in ("file_id", "previous_file_id", "duplicate"):
+            if job.get(field):
+                job[field] = int(job[field])
+        for field in ("created_at", "started_at", "finished_at"):
+            if job.get(field):
+                job[field] = float(job[field])
+        return job
+
+    def update(self, job_id, **fields):
+        self.redis.hset(self.JOB_KEY.format(job_id), mapping=fields)
+
+    def increment(self, job_id, **counters):
+        with self.redis.pipeline() as pipe:
+            for field, amount in counters.items():
+                pipe.hincrby(self.JOB_KEY.format(job_id), field, amount)
+            pipe.execute()
+
+    def finish(self, worker_name, job_id, state, error=""):
+        """Завершает задание и убирает его из списка processing исполнителя."""
+        key = self.JOB_KEY.format(job_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(key, mapping={"state": state, "error": error, "finished_at": time.time()})
+            pipe.expire(key, self.job_ttl)
+            pipe.lrem(self.PROCESSING_KEY.format(worker_name), 0, job_id)
+            pipe.execute()
+
+    def recover(self, worker_name):
+        """
+        Возвращает в очередь задания, которые исполнитель не завершил до перезапуска.
+
+        :return: id возвращённых заданий.
+        """
+        recovered = []
+        processing_key = self.PROCESSING_KEY.format(worker_name)
+        while True:
+            job_id = self.redis.rpoplpush(processing_key, self.QUEUE_KEY)
+            if job_id is None:
+                return recovered
+            self.update(job_id, state="queued")
+            recovered.append(job_id)
+
+    def take(self, worker_name, timeout=5):
+        """
+        Ждёт следующее задание не дольше timeout секунд.
+
+        Задание, прерванное больше max_attempts раз, завершается упавшим, а его файл удаляется.
+
+        :return: id задания или None.
+        """
+        job_id = self.redis.brpoplpush(self.QUEUE_KEY, self.PROCESSING_KEY.format(worker_name), timeout=timeout)
+        if job_id is None:
+            return None
+        attempts = self.redis.hincrby(self.JOB_KEY.format(job_id), "attempts", 1)
+        if attempts > self.max_attempts:
+            self.finish(worker_name, job_id, "failed", f"Gave up after {self.max_attempts} interrupted attempts.")
+            # Исполнитель такое задание не получит, поэтому загруженный файл удаляется здесь
+            file_path = self.redis.hget(self.JOB_KEY.format(job_id), "file_path")
+            if file_path and os.path.exists(file_path):
+                os.remove(file_path)
+            return None
+        self.update(job_id, state="running", started_at=time.time())
+        return job_id
+
+
+def run_ingest_job(queue, job_id, store, registry, chunk_size=500, parse_workers=None, parse_engine="lines"):
+    """
+    Разбирает PDF задания и сохраняет соревнования порциями, обновляя прогресс задания.
+
+    Уже загруженный файл пропускается; страницы, разобранные при загрузке прошлых редакций, берутся
+    из кэша. Соревнования предыдущей редакции, которых нет в новой, помечаются отменёнными.
+
+    :param queue: IngestQueue.
+    :param job_id: id задания, уже взятого через take().
+    :param store: CompetitionStore.
+    :param registry: PdfRegistry.
+    :param chunk_size: Сколько соревнований сохранять в одной транзакции.
+    :param parse_workers: Число процессов PDFParser.
+    :param parse_engine: Движок разбора страниц PDFParser ("lines" или "columns").
+    """
+    job = queue.get(job_id)
+    sha256 = job.get("sha256") or file_sha256(job["file_path"])
+    duplicate_of = registry.find_ingested(sha256)
+    if duplicate_of is not None:
+        queue.update(job_id, sha256=sha256, file_id=duplicate_of, duplicate=1)
+        return
+
+    pdf_parser = PDFParser(engine=parse_engine)
+    page_hashes = pdf_parser.page_hashes(job["file_path"])
+    file_id = registry.register(sha256, job["filename"], page_hashes)
+    reused = registry.lookup(pdf_parser.layout_key(), page_hashes)
+    queue.update(job_id, sha256=sha256, file_id=file_id, pages_parsed=0,
+                 pages_reused=sum(page_hash in reused for page_hash in page_hashes),
+                 rows_parsed=0, rows_inserted=0, rows_updated=0, rows_skipped=0, rows_cancelled=0)
+
+    parsed_data = pdf_parser.iter_parse(job["file_path"], workers=parse_workers,
+                                        on_page=lambda pages: queue.update(job_id, pages_parsed=pages),
+                                        page_cache=registry, page_hashes=page_hashes)
+    ekp_numbers = set()
+
+    while True:
+        chunk = list(islice(parsed_data, chunk_size))
+        if not chunk:
+            break
+        ekp_numbers.update(entry[2] for entry in chunk)
+
+        # One bulk upsert per chunk: new EKP numbers are inserted, changed ones are updated
+        inserted, updated = store.upsert(chunk)
+        queue.increment(job_id, rows_parsed=len(chunk), rows_inserted=len(inserted), rows_updated=len(updated),
+                        rows_skipped=len(chunk) - len(inserted) - len(updated))
+
+    previous = registry.previous_revision(file_id)
+    if previous is not None:
+        cancelled = store.cancel(set(previous[1]) - ekp_numbers)
+        queue.update(job_id, previous_file_id=previous[0], rows_cancelled=len(cancelled))
+    registry.complete(file_id, ekp_numbers)
@@ -0,0 +1,171 @@
+import base64
+import binascii
+import os
+import re
+import shutil
+import tempfile
+from PIL import Image, ImageOps
+from modules.upload_controller import UploadTooLarge, UploadWriter
+
+MEDIA_HASH = re.compile(r"^[0-9a-f]{64}$")
+# Форматы, которые принимаются на загрузку; всё остальное отклоняется до декодирования пикселей
+MEDIA_FORMATS = ("JPEG", "PNG", "WEBP", "GIF")
+
+
+class InvalidImage(ValueError):
+    """Файл не является изображением допустимого формата или слишком велик."""
+
+
+def is_external_url(value, max_length=2048):
+    return bool(value) and len(value) <= max_length and value.startswith(("http://", "https://"))
+
+
+class MediaStore:
+    def __init__(self, directory, sizes=(64, 256, 1024), url_prefix="/media", max_pixels=40_000_000, quality=82):
+        """
+        Изображения (аватары, картинки комментариев) на локальном диске, адресуемые SHA-256 содержимого.
+
+        При загрузке сразу строятся уменьшенные копии фиксированных размеров в WebP; исходный файл не
+        хранится, поэтому метаданные EXIF не попадают в ответы, а размер на диске ограничен. Копии лежат в
+        <directory>/<hash[:2]>/<hash>/<размер>.webp и раздаются nginx: содержимое по адресу никогда не
+        меняется, поэтому его можно кэшировать навсегда. В PostgreSQL хранится только хеш.
+
+        Каталог хеша собирается во временном каталоге и переименовывается целиком, поэтому nginx не
+        увидит его недописанным, а одновременные загрузки одного файла не мешают друг другу.
+
+        :param directory: Каталог, общий с nginx.
+        :param sizes: Размеры уменьшенных копий - наибольшая сторона в пикселях.
+        :param url_prefix: Префикс, по которому nginx раздаёт directory.
+        :param max_pixels: Максимум пикселей исходного изображения (защита от "бомб" распаковки).
+        :param quality: Качество WebP.
+        """
+        self.directory = directory
+        self.sizes = tuple(sorted(sizes))
+        self.url_prefix = url_prefix.rstrip("/")
+        self.max_pixels = max_pixels
+        self.quality = quality
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, media_hash, size=None):
+        directory = os.path.join(self.directory, media_hash[:2], media_hash)
+        return directory if size is None else os.path.join(directory, f"{size}.webp")
+
+    def exists(self, media_hash):
+        return bool(MEDIA_HASH.match(media_hash or "")) and os.path.isdir(self.path(media_hash))
+
+    def urls(self, reference):
+        """
+        :param reference: Хеш из хранилища или внешний http(s) URL.
+        :return: {размер: URL}; для внешнего URL - он же для всех размеров; None для прочих значений.
+        """
+        if MEDIA_HASH.match(reference or ""):
+            return {str(size): f"{self.url_prefix}/{reference[:2]}/{reference}/{size}.webp" for size in self.sizes}
+        if is_external_url(reference):
+            return {str(size): reference for size in self.sizes}
+        return None
+
+    def is_reference(self, value):
+        """Допустимое значение для avatar и images: сохранённый хеш или внешний http(s) URL."""
+        return self.exists(value) or is_external_url(value)
+
+    def upload(self, max_bytes=None):
+        """:return: UploadWriter во временный файл в каталоге хранилища, для put()."""
+        return UploadWriter(self.directory, max_bytes=max_bytes, suffix=".upload")
+
+    def put(self, file_path, media_hash):
+        """
+        Строит уменьшенные копии загруженного файла; сам файл удаляется.
+
+        :param media_hash: SHA-256 файла (UploadWriter.close()).
+        :return: media_hash.
+        :raises InvalidImage:
+        """
+        try:
+            if not self.exists(media_hash):
+                self._store(file_path, media_hash)
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        return media_hash
+
+    def put_bytes(self, data, max_bytes=None):
+        """:return: Хеш сохранённого изображения из байтов в памяти."""
+        upload = self.upload(max_bytes)
+        try:
+            upload.write(data)
+        except BaseException:
+            upload.discard()
+            raise
+        return self.put(upload.path, upload.close())
+
+    def _store(self, file_path, media_hash):
+        try:
+            source = Image.open(file_path)
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            raise InvalidImage(f"Not a valid image ({type(e).__name__}).")
+        with source:
+            if source.format not in MEDIA_FORMATS:
+                raise InvalidImage(f"Unsupported image format: {source.format}.")
+            if source.width * source.height > self.max_pixels:
+                raise InvalidImage(f"Image exceeds {self.max_pixels} pixels.")
+            try:
+                # JPEG сразу декодируется в уменьшенном масштабе, если наибольшая копия это позволяет
+                source.draft("RGB", (self.sizes[-1], self.sizes[-1]))
+                image = ImageOps.exif_transpose(source)
+                image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P", "PA") else "RGB")
+            except (OSError, SyntaxError, ValueError) as e:
+                raise InvalidImage(f"Not a valid image ({type(e).__name__}).")
+
+        parent = os.path.join(self.directory, media_hash[:2])
+        os.makedirs(parent, exist_ok=True)
+        staging = tempfile.mkdtemp(dir=parent, prefix=".tmp-")
+        try:
+            # От большей копии к меньшей: каждая уменьшается из предыдущей, а не из исходника
+            for size in reversed(self.sizes):
+                image.thumbnail((size, size), Image.LANCZOS)
+                image.save(os.path.join(staging, f"{size}.webp"), "WEBP", quality=self.quality, method=4)
+            os.chmod(staging, 0o755)
+            try:
+                os.rename(staging, self.path(media_hash))
+            except OSError:
+                # Тот же файл уже сохранила одновременная загрузка
+                if not os.path.isdir(self.path(media_hash)):
+                    raise
+        finally:
+            if os.path.isdir(staging):
+                shutil.rmtree(staging)
+
+    def migrate_inline_images(self, db, max_bytes=None):
+        """
+        Переносит изображения, сохранённые в базе как data:-URI base64, в хранилище и заменяет их хешами.
+
+        Невалидные изображения удаляются из строк.
+
+        :return: Число перенесённых изображений.
+        """
+        migrated = 0
+        with db.cursor() as cursor:
+            cursor.execute("SELECT id, avatar FROM users WHERE avatar LIKE 'data:%%' FOR UPDATE")
+            for user_id, avatar in cursor.fetchall():
+                media_hash = self._migrate(avatar, max_bytes)
+                cursor.execute("UPDATE users SET avatar = %s WHERE id = %s", (media_hash, user_id))
+                migrated += media_hash is not None
+
+            cursor.execute("""
+                SELECT id, images FROM event_comments
+                WHERE EXISTS (SELECT 1 FROM unnest(images) AS image WHERE image LIKE 'data:%%')
+                FOR UPDATE
+            """)
+            for comment_id, images in cursor.fetchall():
+                hashes = [self._migrate(image, max_bytes) if image.startswith("data:") else image for image in images]
+                cursor.execute("UPDATE event_comments SET images = %s WHERE id = %s",
+                               ([image for image in hashes if image is not None], comment_id))
+                migrated += sum(1 for image, old in zip(hashes, images) if image is not None and image != old)
+        return migrated
+
+    def _migrate(self, data_uri, max_bytes):
+        try:
+            return self.put_bytes(base64.b64decode(data_uri.split(",", 1)[1], validate=True), max_bytes)
+        except (IndexError, binascii.Error, InvalidImage, UploadTooLarge) as e:
+            print(f"Dropping inline image: {str(e)}")
+            return None
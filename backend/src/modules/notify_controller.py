@@ -0,0 +1,122 @@
+import json
+import select
+import threading
+import time
+import psycopg2
+import psycopg2.extensions
+
+# Канал NOTIFY, который заполняют триггеры из modules.schema
+COMPETITIONS_CHANNEL = "competitions_changed"
+
+
+class ChangeFeed:
+    def __init__(self, db_url, poll_timeout=1.0, reconnect_delay=1.0, max_reconnect_delay=30.0):
+        """
+        Лента изменений таблиц через PostgreSQL LISTEN/NOTIFY.
+
+        Триггеры на таблицах шлют в канал id изменённых строк после фиксации транзакции, кто бы её ни
+        выполнил: этот процесс, другой рабочий процесс API или исполнитель загрузки. Фоновый поток
+        держит отдельное соединение вне пула, собирает всё, что пришло, и передаёт обработчикам
+        множество id по каналу.
+
+        Уведомления, отправленные, пока соединения нет, теряются, поэтому после каждого подключения
+        (уже после LISTEN) вызывается resync подписчика - он догружает пропущенное сам.
+
+        :param db_url: Строка подключения к PostgreSQL.
+        :param poll_timeout: Как часто проверять остановку, в секундах (по умолчанию 1).
+        :param reconnect_delay: Первая пауза перед переподключением, удваивается до max_reconnect_delay.
+        :param max_reconnect_delay: Максимальная пауза перед переподключением (по умолчанию 30).
+        """
+        self.db_url = db_url
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.handlers = {}
+        self.resyncs = []
+        self.stopped = threading.Event()
+        self.thread = None
+        self.metrics_lock = threading.Lock()
+        self.notifications = 0
+        self.connects = 0
+        self.last_applied = None
+
+    def subscribe(self, channel, handler, resync=None):
+        """
+        :param channel: Канал NOTIFY.
+        :param handler: Функция, которая получает множество id изменённых строк. Строка могла быть
+                        добавлена, изменена или удалена - обработчик сам перечитывает её состояние.
+        :param resync: Необязательная функция без аргументов, вызывается после каждого подключения.
+        """
+        self.handlers.setdefault(channel, []).append(handler)
+        if resync is not None:
+            self.resyncs.append(resync)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="change-feed", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join(timeout=self.poll_timeout * 2)
+
+    def connect(self):
+        # keepalive, чтобы молча пропавшее соединение обнаружилось, а не ждало уведомлений вечно
+        conn = psycopg2.connect(self.db_url, keepalives=1, keepalives_idle=30, keepalives_interval=10,
+                                keepalives_count=3)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cursor:
+            for channel in self.handlers:
+                cursor.execute(f'LISTEN "{channel}"')
+        return conn
+
+    def run(self):
+        delay = self.reconnect_delay
+        while not self.stopped.is_set():
+            conn = None
+            try:
+                conn = self.connect()
+                with self.metrics_lock:
+                    self.connects += 1
+                for resync in self.resyncs:
+                    resync()
+                delay = self.reconnect_delay
+                self.listen(conn)
+            except Exception as e:
+                print(f"Error in change feed, reconnecting in {delay:.0f}s: {str(e)}")
+                self.stopped.wait(delay)
+                delay = min(delay * 2, self.max_reconnect_delay)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+    def listen(self, conn):
+        while not self.stopped.is_set():
+            if select.select([conn], [], [], self.poll_timeout) == ([], [], []):
+                continue
+            conn.poll()
+            # Всё, что успело прийти, применяется одной пачкой на канал
+            changed = {}
+            while conn.notifies:
+                notify = conn.notifies.pop(0)
+                payload = json.loads(notify.payload)
+                changed.setdefault(notify.channel, set()).update(payload["ids"])
+                with self.metrics_lock:
+                    self.notifications += 1
+            # Ошибка обработчика рвёт соединение: после переподключения resync догрузит то, что не применилось
+            for channel, ids in changed.items():
+                for handler in self.handlers.get(channel, []):
+                    handler(ids)
+            if changed:
+                with self.metrics_lock:
+                    self.last_applied = time.time()
+
+    def stats(self):
+        with self.metrics_lock:
+            return {
+                "running": self.thread is not None and self.thread.is_alive(),
+                "channels": sorted(self.handlers),
+                "notifications_total": self.notifications,
+                "connects_total": self.connects,
+                "last_applied": self.last_applied,
+            }
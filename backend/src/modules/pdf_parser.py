@@ -1,9 +1,191 @@
+import hashlib
+import multiprocessing
+import numpy as np
+import os
 import pdfplumber
 import re
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from pdfminer.layout import LTChar, LTContainer
+from pdfminer.pdftypes import PDFObjRef, PDFStream, resolve1
+from pdfminer.psparser import PSLiteral
+
+PARSER_ENGINES = ("lines", "columns")
+# Разделитель колонок в строках движка columns
+CELL_SEPARATOR = "\x1f"
+EKP_NUMBER = re.compile(r'(\d{16})')
+# Допуски группировки символов в слова, как у pdfplumber extract_words() по умолчанию
+WORD_X_TOLERANCE = 3
+WORD_Y_TOLERANCE = 3
+# Меньше страниц на процесс не окупают запуск процесса spawn: он заново импортирует pdfplumber и открывает PDF
+MIN_PAGES_PER_WORKER = 50
+LIGATURES = {"ﬀ": "ff", "ﬃ": "ffi", "ﬄ": "ffl", "ﬁ": "fi", "ﬂ": "fl", "ﬆ": "st", "ﬅ": "st"}
+
+
+def file_sha256(file_path, chunk_size=1024 * 1024):
+    """SHA-256 файла, читаемого порциями."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_digest(obj, digests, visiting=None):
+    """
+    SHA-256 объекта PDF вместе со всем, на что он ссылается: словари и массивы сериализуются,
+    у потоков учитываются словарь и данные.
+
+    :param digests: Кэш id объекта -> хеш в пределах одного документа; общий шрифт хешируется один раз.
+    :param visiting: id объектов на текущем пути - защита от циклических ссылок.
+    """
+    visiting = visiting if visiting is not None else set()
+    if isinstance(obj, PDFObjRef):
+        if obj.objid in digests:
+            return digests[obj.objid]
+        if obj.objid in visiting:
+            return hashlib.sha256(b"cycle").hexdigest()
+        visiting.add(obj.objid)
+        digest = object_digest(obj.resolve(), digests, visiting)
+        visiting.discard(obj.objid)
+        digests[obj.objid] = digest
+        return digest
+
+    digest = hashlib.sha256()
+    if isinstance(obj, PDFStream):
+        digest.update(b"stream" + object_digest(obj.attrs, digests, visiting).encode())
+        digest.update(obj.get_data())
+    elif isinstance(obj, dict):
+        digest.update(b"dict")
+        for key in sorted(obj, key=str):
+            digest.update(str(key).encode() + object_digest(obj[key], digests, visiting).encode())
+    elif isinstance(obj, (list, tuple)):
+        digest.update(b"list")
+        for item in obj:
+            digest.update(object_digest(item, digests, visiting).encode())
+    elif isinstance(obj, PSLiteral):
+        digest.update(b"name" + repr(obj.name).encode())
+    else:
+        digest.update(repr(obj).encode())
+    return digest.hexdigest()
+
+
+def available_cpus():
+    """Число ядер, на которых процессу разрешено выполняться (с учётом cpuset контейнера)."""
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+class WordLayout:
+    # Меняется вместе с форматом файла или правилами группировки слов в page_words()
+    FORMAT_VERSION = 1
+
+    def __init__(self, text, text_ends, boxes, page_ends):
+        """
+        Слова всех страниц PDF в колоночном виде - то, что отдаёт PDFParser.page_words(), без самого PDF.
+
+        Движки разбора работают только со словами и их координатами, поэтому разбор по WordLayout
+        с любыми параметрами PDFParser даёт то же, что разбор исходного файла, но без pdfminer.
+
+        :param text: Тексты всех слов подряд одной строкой.
+        :param text_ends: Конец каждого слова в text (массив int64).
+        :param boxes: Массив n x 4 с колонками x0, x1, top, height.
+        :param page_ends: Конец слов каждой страницы в boxes (массив int64).
+        """
+        self.text = text
+        self.text_ends = text_ends
+        self.boxes = boxes
+        self.page_ends = page_ends
+
+    @classmethod
+    def from_pages(cls, pages):
+        """Собирает WordLayout из (тексты, массив координат) по страницам."""
+        texts = []
+        boxes = []
+        page_ends = []
+        for page_texts, page_boxes in pages:
+            texts.extend(page_texts)
+            boxes.append(page_boxes)
+            page_ends.append(len(texts))
+        return cls("".join(texts), np.cumsum([len(text) for text in texts], dtype=np.int64),
+                   np.concatenate(boxes) if boxes else np.empty((0, 4)), np.asarray(page_ends, dtype=np.int64))
+
+    def __len__(self):
+        return len(self.page_ends)
+
+    def page(self, index):
+        """
+        Слова одной страницы.
+
+        :return: (тексты слов, массив n x 4 с колонками x0, x1, top, height).
+        """
+        start = int(self.page_ends[index - 1]) if index else 0
+        end = int(self.page_ends[index])
+        ends = self.text_ends[start:end].tolist()
+        starts = [int(self.text_ends[start - 1]) if start else 0] + ends[:-1]
+        return [self.text[begin:finish] for begin, finish in zip(starts, ends)], self.boxes[start:end]
+
+    def __iter__(self):
+        return (self.page(index) for index in range(len(self)))
+
+    def save(self, path):
+        """Пишет сжатый .npz без pickle; файл заменяется атомарно, читатели не увидят его наполовину."""
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                np.savez_compressed(file, version=np.int64(self.FORMAT_VERSION),
+                                    text=np.frombuffer(self.text.encode("utf-8"), dtype=np.uint8),
+                                    text_ends=self.text_ends, boxes=self.boxes, page_ends=self.page_ends)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path, allow_pickle=False) as data:
+            if int(data["version"]) != cls.FORMAT_VERSION:
+                raise ValueError(f"Unsupported word layout version {int(data['version'])} in {path}")
+            return cls(data["text"].tobytes().decode("utf-8"), data["text_ends"], data["boxes"], data["page_ends"])
+
+
+class WordCache:
+    def __init__(self, directory):
+        """
+        Каталог WordLayout по SHA-256 содержимого PDF.
+
+        Извлечение слов - самая медленная часть разбора и не зависит от параметров PDFParser, поэтому
+        подбор threshold_distance, header_height и sport_names_text_height или смена движка повторно
+        читают только файл кэша.
+
+        :param directory: Каталог для файлов <sha256>.npz; создаётся при необходимости.
+        """
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, sha256):
+        return os.path.join(self.directory, f"{sha256}.npz")
+
+    def get(self, sha256):
+        """WordLayout файла или None, если его нет в кэше или файл кэша не читается."""
+        path = self.path(sha256)
+        if not os.path.exists(path):
+            return None
+        try:
+            return WordLayout.load(path)
+        except Exception as e:
+            print(f"Ignoring unreadable word cache {path}: {str(e)}")
+            return None
+
+    def put(self, sha256, layout):
+        layout.save(self.path(sha256))
+
 
 class PDFParser:
     def __init__(self, threshold_distance=20, header_height=7, sport_names_text_height=12,
-                 sport_compositions_names=None):
+                 sport_compositions_names=None, engine="lines"):
         """
         Инициализация парсера PDF.
 
@@ -12,101 +194,468 @@ class PDFParser:
         :param header_height: Количество строк заголовка для пропуска (по умолчанию 7).
         :param sport_names_text_height: Высота текста названий видов спорта (по умолчанию 12).
         :param sport_compositions_names: Список названий составов спорта для поиска (по умолчанию ["Основной состав", "Молодежный (резервный) состав"]).
+        :param engine: "lines" - строки из слов с разделителем '|' и поля по порядку (по умолчанию);
+                       "columns" - колоночная модель страницы, поля берутся из колонок таблицы.
         """
+        if engine not in PARSER_ENGINES:
+            raise ValueError(f"Unknown parser engine: {engine}")
+        self.engine = engine
         self.threshold_distance = threshold_distance
         self.header_height = header_height
         self.sport_names_text_height = sport_names_text_height
         self.sport_compositions_names = sport_compositions_names or ["Основной состав", "Молодежный (резервный) состав"]
 
-    def parse(self, pdf_path):
+    def extract_page_lines(self, texts, boxes):
         """
-        Парсит PDF файл и извлекает информацию о спортивных соревнованиях.
+        Собирает строки страницы из слов и находит на ней названия видов спорта.
 
-        :return: Список кортежей, содержащих извлеченную информацию о соревнованиях.
+        :param texts: Тексты слов страницы, как их возвращает page_words().
+        :param boxes: Массив n x 4 с колонками x0, x1, top, height.
+        :return: (строки страницы, найденные названия видов спорта).
         """
-        with pdfplumber.open(pdf_path) as pdf:
-            final_string = ""
-            sport_composition = "default"
-            sport_name = "default"
-            sport_names = []
-            final_mas = []
-            
-            for ind, page in enumerate(pdf.pages[0:50]):  # Обработка первых 50 страниц
-                words = page.extract_words()
-                processed_lines = []
+        processed_lines = []
+        sport_names = []
+        current_line = []
+        x0, x1, top = boxes[:, 0].tolist(), boxes[:, 1].tolist(), boxes[:, 2].tolist()
+        heights = [int(height) for height in boxes[:, 3].tolist()]
+
+        for i in range(len(texts)):
+            current_word = texts[i]
+            current_line.append(current_word)
+            if heights[i] == self.sport_names_text_height:
+                spn = ""
+                spn += texts[i]
+                for j in range(1, 9):
+                    if (i + j < len(texts) and heights[i + j] == self.sport_names_text_height and
+                            heights[i - j] != self.sport_names_text_height):
+                        spn += " " + texts[i + j]
+                    else:
+                        if heights[i - j] != self.sport_names_text_height:
+                            sport_names.append(spn)
+                        break
+
+            if i < len(texts) - 1:
+                distance = x0[i + 1] - x1[i]
+                if distance > self.threshold_distance:
+                    current_line.append('|')
+
+            if i == len(texts) - 1 or top[i] != top[i + 1]:
+                processed_line = ' '.join(current_line)
+                processed_lines.append(processed_line)
                 current_line = []
-                
-                for i in range(len(words)):
-                    current_word = words[i]['text']
-                    current_line.append(current_word)
-                    if int(words[i]['height']) == self.sport_names_text_height:
-                        spn = ""
-                        spn += words[i]['text']
-                        for j in range(1, 9):
-                            if (i + j < len(words) and int(words[i + j]['height']) == self.sport_names_text_height and
-                                    int(words[i - j]['height']) != self.sport_names_text_height):
-                                spn += " " + words[i + j]['text']
-                            else:
-                                if int(words[i - j]['height']) != self.sport_names_text_height:
-                                    sport_names.append(spn)
-                                break
-                    
-                    if i < len(words) - 1:
-                        distance = words[i + 1]['x0'] - words[i]['x1']
-                        if distance > self.threshold_distance:
-                            current_line.append('|')
-                    
-                    if i == len(words) - 1 or words[i]['top'] != words[i + 1]['top']:
-                        processed_line = ' '.join(current_line)
-                        processed_lines.append(processed_line)
-                        current_line = []
-                
-                if ind == 0:
-                    processed_lines = processed_lines[self.header_height:]
-
-                for line in processed_lines:
-                    if "Стр." in line:
-                        continue
-                    
-                    line = line.strip()
-
-                    if line == line.upper() and "|" not in line and line.strip() in sport_names:
-                        sport_name = line
-                        continue
-                    
-                    if line in self.sport_compositions_names:
-                        sport_composition = line
-                        continue
-                    
-                    if sport_composition != "default" and sport_name != "default":
-                        number_match = re.match(r'(\d{16})', line)
-                        if number_match:
-                            number = number_match.group(0)
-                            final_string += f" | {sport_name} | {sport_composition}\n\n\n"
-                            final_string += f" | {number} | {line[len(number):].strip()}\n"
-                        else:
-                            final_string += f" | {line}\n"
-                            if line == processed_lines[-2]:
-                                final_string += f" {sport_name} | {sport_composition} "
-
-        for line in final_string.strip().split("\n\n\n"):
-            try:
-                new = line.strip()[1:].split("|")
-                ekp_number = new[0].strip()
-                competition_class = new[1].strip()
-                date_start = new[2].strip()
-                country = new[3].strip()
-                max_people_count = new[4].strip()
-                genders_and_ages = new[5].strip()
-                date_end = new [6].strip()
-                city = new[7].strip()
-                discipline = " ".join([" ".join(x.strip().split("|")) for x in new[8:-2]])
-                sport_name = new[-2].strip()
-                sport_composition = new[-1].strip()
-            except Exception as e:
-                print("skip", e)
+
+        return processed_lines, sport_names
+
+    @staticmethod
+    def page_words(page):
+        """
+        Слова страницы в виде массивов - то же, что pdfplumber extract_words(), но без словарей.
+
+        pdfplumber превращает каждый объект страницы в словарь со всеми атрибутами, и на это уходит
+        около половины времени разбора; здесь символы pdfminer читаются напрямую и группируются
+        в слова по тем же правилам: строки - кластеры по top с допуском WORD_Y_TOLERANCE, слово
+        разрывается пробелом, промежутком больше WORD_X_TOLERANCE или возвратом влево.
+
+        :return: (тексты слов, массив n x 4 с колонками x0, x1, top, height).
+        """
+        chars = []
+        stack = [iter(page.layout)]
+        while stack:
+            obj = next(stack[-1], None)
+            if obj is None:
+                stack.pop()
+            elif isinstance(obj, LTChar):
+                if obj.upright:
+                    chars.append(obj)
+            elif isinstance(obj, LTContainer):
+                stack.append(iter(obj))
+        if not chars:
+            return [], np.empty((0, 4))
+
+        mediabox_x0, mediabox_top = page.mediabox[:2]
+        texts = np.array([LIGATURES.get(char.get_text(), char.get_text()) for char in chars], dtype=object)
+        x0 = np.fromiter((char.x0 for char in chars), dtype=np.float64, count=len(chars)) + mediabox_x0
+        x1 = np.fromiter((char.x1 for char in chars), dtype=np.float64, count=len(chars)) + mediabox_x0
+        top = page.height - np.fromiter((char.y1 for char in chars), dtype=np.float64, count=len(chars)) + mediabox_top
+        bottom = page.height - np.fromiter((char.y0 for char in chars), dtype=np.float64, count=len(chars)) + mediabox_top
+
+        # Строки: цепочки значений top, соседние не дальше допуска
+        tops = np.unique(top)
+        clusters = np.concatenate(([0], np.cumsum(np.diff(tops) > WORD_Y_TOLERANCE)))
+        line = clusters[np.searchsorted(tops, top)]
+        order = np.lexsort((x0, line))
+        texts, x0, x1, top, bottom, line = texts[order], x0[order], x1[order], top[order], bottom[order], line[order]
+
+        blank = np.fromiter((text.isspace() for text in texts), dtype=bool, count=len(texts))
+        new_word = np.ones(len(texts), dtype=bool)
+        new_word[1:] = ((line[1:] != line[:-1]) | (x0[1:] < x0[:-1]) | (x0[1:] > x1[:-1] + WORD_X_TOLERANCE) |
+                        (np.abs(top[1:] - top[:-1]) > WORD_Y_TOLERANCE) | blank[:-1])
+        keep = ~blank
+        word = np.cumsum(new_word)[keep] - 1
+        _, word = np.unique(word, return_inverse=True)
+        texts, x0, x1, top, bottom = texts[keep], x0[keep], x1[keep], top[keep], bottom[keep]
+        if not len(texts):
+            return [], np.empty((0, 4))
+
+        starts = np.flatnonzero(np.concatenate(([True], word[1:] != word[:-1])))
+        ends = np.append(starts[1:], len(texts))
+        word_top = np.minimum.reduceat(top, starts)
+        boxes = np.column_stack((np.minimum.reduceat(x0, starts), np.maximum.reduceat(x1, starts), word_top,
+                                 np.maximum.reduceat(bottom, starts) - word_top))
+        return ["".join(texts[start:end]) for start, end in zip(starts, ends)], boxes
+
+    def extract_page_cells(self, texts, boxes):
+        """
+        Колоночная модель страницы для движка columns.
+
+        Слова раскладываются на строки и ячейки по координатам; колонки таблицы определяются один раз
+        на страницу по строкам с номером ЕКП: для каждой колонки берётся медианное начало ячейки.
+        Затем каждая ячейка страницы относится к колонке, в которую попадает её левый край.
+
+        :param texts: Тексты слов страницы, как их возвращает page_words().
+        :param boxes: Массив n x 4 с колонками x0, x1, top, height.
+        :return: (строки страницы, где тексты колонок разделены CELL_SEPARATOR, названия видов спорта).
+        """
+        if not texts:
+            return [], []
+        count = len(texts)
+        x0, x1, top = boxes[:, 0], boxes[:, 1], boxes[:, 2]
+        height = boxes[:, 3].astype(np.int64)
+
+        # Новая строка - там, где меняется top; новая ячейка - в начале строки или после большого промежутка
+        line_start = np.ones(count, dtype=bool)
+        line_start[1:] = top[1:] != top[:-1]
+        cell_start = line_start.copy()
+        cell_start[1:] |= x0[1:] - x1[:-1] > self.threshold_distance
+        starts = np.flatnonzero(cell_start)
+        ends = np.append(starts[1:], count)
+        cell_line = np.cumsum(line_start)[starts] - 1
+        cell_x0 = x0[starts]
+        cell_texts = [" ".join(texts[start:end]) for start, end in zip(starts, ends)]
+
+        # Названия видов спорта - подряд идущие слова крупного шрифта
+        is_title = height == self.sport_names_text_height
+        title_start = is_title & ~np.concatenate(([False], is_title[:-1]))
+        title_end = is_title & ~np.concatenate((is_title[1:], [False]))
+        sport_names = [" ".join(texts[start:end + 1])
+                       for start, end in zip(np.flatnonzero(title_start), np.flatnonzero(title_end))]
+
+        # Колонки по строкам с номером ЕКП, у которых самое частое число ячеек
+        line_count = int(cell_line[-1]) + 1
+        first_cells = np.searchsorted(cell_line, np.arange(line_count))
+        cells_per_line = np.bincount(cell_line, minlength=line_count)
+        record_lines = np.asarray([line for line in range(line_count)
+                                   if EKP_NUMBER.match(cell_texts[first_cells[line]])], dtype=np.int64)
+        if len(record_lines):
+            columns = np.bincount(cells_per_line[record_lines]).argmax()
+            record_lines = record_lines[cells_per_line[record_lines] == columns]
+            offsets = first_cells[record_lines][:, None] + np.arange(columns)
+            anchors = np.median(cell_x0[offsets], axis=0)
+            # Ячейка, начатая чуть левее колонки (центрированный текст), относится к ней же
+            cell_column = np.searchsorted(anchors - self.threshold_distance, cell_x0, side="right") - 1
+            cell_column = np.clip(cell_column, 0, columns - 1)
+        else:
+            # На странице нет записей (только заголовки) - вся строка в одной колонке
+            columns = 1
+            cell_column = np.zeros(len(starts), dtype=np.int64)
+
+        processed_lines = []
+        slots = None
+        for line, column, text in zip(cell_line.tolist(), cell_column.tolist(), cell_texts):
+            if slots is None or line != current_line:
+                if slots is not None:
+                    processed_lines.append(CELL_SEPARATOR.join(slots))
+                slots = [""] * columns
+                current_line = line
+            slots[column] = f"{slots[column]} {text}" if slots[column] else text
+        processed_lines.append(CELL_SEPARATOR.join(slots))
+        return processed_lines, sport_names
+
+    def extract_page(self, texts, boxes):
+        """(строки, названия видов спорта) страницы по её словам выбранным движком."""
+        if self.engine == "columns":
+            return self.extract_page_cells(texts, boxes)
+        return self.extract_page_lines(texts, boxes)
+
+    def iter_page_words(self, pdf_path, indices=None):
+        """
+        Выдаёт слова страниц (page_words) по одной.
+
+        После страницы её кэш разметки сбрасывается, поэтому память не растёт с числом страниц.
+
+        :param indices: Номера страниц (с нуля) по возрастанию; None - все страницы.
+        """
+        with pdfplumber.open(pdf_path) as pdf:
+            pages = pdf.pages if indices is None else [pdf.pages[index] for index in indices]
+            for page in pages:
+                try:
+                    yield self.page_words(page)
+                finally:
+                    page.flush_cache()
+
+    def extract_page_words(self, pdf_path, indices):
+        """Извлекает слова заданных страниц; каждый процесс открывает PDF сам."""
+        return list(self.iter_page_words(pdf_path, indices))
+
+    def iter_pages(self, pdf_path, indices=None):
+        """Выдаёт (строки, названия видов спорта) страниц по одной."""
+        for words in self.iter_page_words(pdf_path, indices):
+            yield self.extract_page(*words)
+
+    def iter_words(self, pdf_path, indices, workers=None):
+        """
+        Выдаёт слова страниц indices в их порядке.
+
+        :param workers: Наибольшее число процессов; None или 1 - последовательное извлечение в текущем
+                        процессе. Процессов не больше доступных ядер и не больше одного на
+                        MIN_PAGES_PER_WORKER страниц, иначе запуск процессов дороже самого разбора.
+        """
+        workers = min(workers or 1, available_cpus(), len(indices) // MIN_PAGES_PER_WORKER)
+        if workers <= 1:
+            yield from self.iter_page_words(pdf_path, indices)
+            return
+
+        # Несколько небольших диапазонов на процесс, чтобы выровнять нагрузку
+        chunk_size = max(1, len(indices) // (workers * 4))
+        chunks = [indices[start:start + chunk_size] for start in range(0, len(indices), chunk_size)]
+        # spawn, а не fork: парсер запускается из многопоточного процесса бэкенда
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            # В очереди не больше двух диапазонов на процесс, чтобы готовые страницы не копились в памяти
+            submitted = iter(chunks)
+            pending = deque()
+            for _ in range(len(chunks)):
+                while len(pending) < workers * 2:
+                    chunk = next(submitted, None)
+                    if chunk is None:
+                        break
+                    pending.append(executor.submit(self.extract_page_words, pdf_path, chunk))
+                yield from pending.popleft().result()
+
+    def read_layout(self, pdf_path, workers=None, word_cache=None, sha256=None):
+        """
+        Слова всех страниц PDF; с word_cache извлекаются только при первом обращении к файлу.
+
+        WordLayout держится в памяти целиком (около 50 байт на слово).
+
+        :param workers: Число процессов для извлечения слов.
+        :param word_cache: Необязательный WordCache.
+        :param sha256: Уже посчитанный file_sha256(pdf_path).
+        """
+        if word_cache is not None:
+            sha256 = sha256 or file_sha256(pdf_path)
+            layout = word_cache.get(sha256)
+            if layout is not None:
+                return layout
+        with pdfplumber.open(pdf_path) as pdf:
+            page_count = len(pdf.pages)
+        layout = WordLayout.from_pages(self.iter_words(pdf_path, list(range(page_count)), workers))
+        if word_cache is not None:
+            word_cache.put(sha256, layout)
+        return layout
+
+    @staticmethod
+    def page_hashes(pdf_path):
+        """
+        Хеши содержимого страниц: потоки команд, размер страницы и ресурсы (шрифты, XObject).
+
+        Считаются без разбора разметки, поэтому на порядки быстрее extract_words(); страница с тем же
+        хешем даёт те же строки. Ресурсы входят в хеш, потому что тот же поток команд с другими шрифтами
+        даёт другой текст.
+        """
+        hashes = []
+        digests = {}
+        with pdfplumber.open(pdf_path) as pdf:
+            for page in pdf.pages:
+                page_hash = hashlib.sha256(repr(page.page_obj.mediabox).encode())
+                page_hash.update(object_digest(page.page_obj.resources, digests).encode())
+                for stream in page.page_obj.contents:
+                    page_hash.update(resolve1(stream).get_data())
+                hashes.append(page_hash.hexdigest())
+        return hashes
+
+    def layout_key(self):
+        """Параметры, от которых зависят строки страницы: с другими параметрами кэш страниц не годится."""
+        if self.engine == "columns":
+            return f"columns:{self.threshold_distance}:{self.sport_names_text_height}"
+        return f"{self.threshold_distance}:{self.sport_names_text_height}"
+
+    def iter_page_lines(self, pdf_path, workers=None, cached=None, layout=None):
+        """
+        Выдаёт (строки, названия видов спорта) по страницам в порядке документа.
+
+        :param workers: Число процессов; None или 1 - последовательный разбор в текущем процессе.
+        :param cached: Уже известные результаты страниц: номер страницы -> (строки, названия видов спорта).
+                       Эти страницы не разбираются.
+        :param layout: WordLayout документа; с ним PDF не открывается.
+        """
+        cached = cached or {}
+        if layout is not None:
+            for index in range(len(layout)):
+                yield cached[index] if index in cached else self.extract_page(*layout.page(index))
+            return
+
+        with pdfplumber.open(pdf_path) as pdf:
+            page_count = len(pdf.pages)
+        missing = [index for index in range(page_count) if index not in cached]
+        extracted = self.iter_words(pdf_path, missing, workers)
+        for index in range(page_count):
+            yield cached[index] if index in cached else self.extract_page(*next(extracted))
+
+    @staticmethod
+    def build_record(number, lines, sport_name, sport_composition):
+        """
+        Раскладывает строки одной записи календаря по полям.
+
+        :param number: Номер ЕКП из первой строки записи.
+        :param lines: Текст первой строки после номера и все последующие строки записи.
+        :return: Кортеж полей соревнования или None, если запись не разбирается.
+        """
+        new = [number] + "|".join(lines).split("|")
+        try:
+            ekp_number = new[0].strip()
+            competition_class = new[1].strip()
+            date_start = new[2].strip()
+            country = new[3].strip()
+            max_people_count = new[4].strip()
+            genders_and_ages = new[5].strip()
+            date_end = new[6].strip()
+            city = new[7].strip()
+            discipline = " ".join(x.strip() for x in new[8:])
+        except IndexError as e:
+            print("skip", e)
+            return None
+        return (sport_name, sport_composition, ekp_number, date_start, date_end, city, discipline, competition_class, country, max_people_count, genders_and_ages)
+
+    @staticmethod
+    def build_column_record(number, lines, sport_name, sport_composition):
+        """
+        Раскладывает строки одной записи движка columns по полям.
+
+        Последние три колонки таблицы - сроки, место и число участников с дисциплинами; всё левее -
+        номер и наименование. В первой строке записи: номер, класс соревнования, дата начала, страна,
+        число участников; в следующих: пол и возраст, дата окончания, город, дисциплины. Продолжение
+        ячейки на следующей строке остаётся в своей колонке.
+
+        :param number: Номер ЕКП из первой строки записи.
+        :param lines: Строки записи с колонками, разделёнными CELL_SEPARATOR.
+        :return: Кортеж полей соревнования или None, если запись не разбирается.
+        """
+        rows = [line.split(CELL_SEPARATOR) for line in lines]
+        columns = len(rows[0])
+        if columns < 4:
+            print("skip", f"{number}: {columns} columns")
+            return None
+
+        def join(cells):
+            return " ".join(cell.strip() for cell in cells if cell.strip())
+
+        lead = columns - 3
+        first = rows[0]
+        competition_class = join(first[:lead])[len(number):].strip()
+        date_start, country, max_people_count = (cell.strip() for cell in first[lead:])
+        genders_and_ages, date_end, city, discipline = [], [], [], []
+        for row in rows[1:]:
+            if len(row) != columns:
+                # Строка с другой разметкой (например, перенос записи на страницу без колонок)
+                discipline.append(join(row))
                 continue
-            
-            final_mas.append((sport_name, sport_composition, ekp_number, date_start, date_end, city, discipline, competition_class, country, max_people_count, genders_and_ages))  # Вывод нужной информации
-        
-        return final_mas
\ No newline at end of file
+            genders_and_ages.append(join(row[:lead]))
+            date_end.append(row[lead].strip())
+            city.append(row[lead + 1].strip())
+            discipline.append(row[lead + 2].strip())
+        return (sport_name, sport_composition, number, date_start, join(date_end[:1]), join(city), join(discipline),
+                competition_class, country, max_people_count, join(genders_and_ages))
+
+    def iter_parse(self, pdf_path=None, workers=None, on_page=None, page_cache=None, page_hashes=None,
+                   word_cache=None, layout=None):
+        """
+        Парсит PDF файл и выдаёт соревнования по мере того, как завершается каждая запись.
+
+        Запись открывается строкой с 16-значным номером ЕКП и закрывается следующей такой строкой
+        или концом документа; вид спорта и состав берутся те, что действуют на момент её открытия.
+        Число страниц не ограничено, в памяти держится только текущая страница и текущая запись.
+
+        :param pdf_path: Путь к PDF файлу для парсинга.
+        :param workers: Число процессов для параллельного извлечения страниц (по умолчанию - без параллелизма).
+        :param on_page: Необязательная функция, которая получает число уже разобранных страниц.
+        :param page_cache: Необязательный кэш строк страниц по хешу содержимого с методами
+                           lookup(layout_key, hashes) -> {хеш: (строки, названия видов спорта)} и
+                           store(layout_key, page_hash, result). Страницы из кэша не разбираются заново.
+        :param page_hashes: Уже посчитанные page_hashes(pdf_path), чтобы не считать их второй раз.
+        :param word_cache: Необязательный WordCache: слова страниц берутся из него, а при первом разборе
+                           файла извлекаются целиком и сохраняются туда.
+        :param layout: Готовый WordLayout вместо pdf_path, например из файла кэша без исходного PDF.
+        :return: Генератор кортежей с информацией о соревнованиях.
+        """
+        sport_composition = "default"
+        sport_name = "default"
+        sport_names = set()
+        record = None
+
+        if layout is None and word_cache is not None:
+            layout = self.read_layout(pdf_path, workers, word_cache)
+
+        cached = {}
+        if page_cache is not None:
+            page_hashes = page_hashes or self.page_hashes(pdf_path)
+            known = page_cache.lookup(self.layout_key(), page_hashes)
+            cached = {index: known[page_hash] for index, page_hash in enumerate(page_hashes) if page_hash in known}
+
+        columns = self.engine == "columns"
+        build_record = self.build_column_record if columns else self.build_record
+
+        for ind, page_result in enumerate(self.iter_page_lines(pdf_path, workers, cached, layout)):
+            if page_cache is not None and ind not in cached:
+                page_cache.store(self.layout_key(), page_hashes[ind], page_result)
+            processed_lines, page_sport_names = page_result
+            sport_names.update(page_sport_names)
+
+            if ind == 0:
+                processed_lines = processed_lines[self.header_height:]
+
+            for line in processed_lines:
+                if "Стр." in line:
+                    continue
+
+                # В строках движка columns заголовки и составы сравниваются по тексту без разделителей колонок
+                text = " ".join(line.replace(CELL_SEPARATOR, " ").split()) if columns else line.strip()
+
+                if text == text.upper() and "|" not in text and text in sport_names:
+                    sport_name = text
+                    continue
+
+                if text in self.sport_compositions_names:
+                    sport_composition = text
+                    continue
+
+                if sport_composition == "default" or sport_name == "default":
+                    continue
+
+                number_match = EKP_NUMBER.match(text)
+                if number_match:
+                    if record is not None:
+                        parsed = build_record(*record)
+                        if parsed:
+                            yield parsed
+                    number = number_match.group(0)
+                    record = (number, [line if columns else text[len(number):]], sport_name, sport_composition)
+                elif record is not None:
+                    record[1].append(line if columns else text)
+
+            if on_page is not None:
+                on_page(ind + 1)
+
+        if record is not None:
+            parsed = build_record(*record)
+            if parsed:
+                yield parsed
+
+    def parse(self, pdf_path, workers=None):
+        """
+        Парсит PDF файл и извлекает информацию о спортивных соревнованиях.
+
+        :param pdf_path: Путь к PDF файлу для парсинга.
+        :param workers: Число процессов для параллельного извлечения страниц (по умолчанию - без параллелизма).
+        :return: Список кортежей, содержащих извлеченную информацию о соревнованиях.
+        """
+        return list(self.iter_parse(pdf_path, workers))
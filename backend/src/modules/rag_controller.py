@@ -1,74 +1,657 @@
+import fcntl
+import json
+import os
+import threading
+import time
+from datetime import datetime
 import numpy as np
-import psycopg2
+import scipy.sparse as sp
 from sklearn.feature_extraction.text import TfidfVectorizer
 import faiss  # Facebook AI Similarity Search
 
+# Колонки, по которым строится индекс; id идёт первым и в текст не попадает
+COMPETITION_COLUMNS = ["id", "sport_name", "sport_composition", "ekp_number", "date_start", "date_end", "city",
+                       "discipline", "competition_class", "country", "max_people_count", "genders_and_ages"]
+
+# Версия формата снапшота; при несовпадении снапшот игнорируется и индекс строится заново
+SNAPSHOT_VERSION = 2
+
+
+class FaissIndex:
+    """
+    Плотный индекс FAISS. Векторы TF-IDF нормированы, поэтому скалярное произведение равно косинусу.
+
+    Индекс из снапшота (load) - только для чтения: векторы открыты через np.load(mmap_mode='r') и ищутся
+    faiss.knn прямо по отображённому файлу. IndexFlatIP копирует векторы в память процесса даже с
+    IO_FLAG_MMAP, поэтому в снапшоте хранится матрица .npy, а не файл индекса.
+    """
+
+    def __init__(self, dimension, index=None, vectors=None):
+        self.vectors = vectors
+        self.index = None if vectors is not None else (index if index is not None else faiss.IndexFlatIP(dimension))
+
+    @property
+    def dimension(self):
+        return self.vectors.shape[1] if self.vectors is not None else self.index.d
+
+    @property
+    def ntotal(self):
+        return self.vectors.shape[0] if self.vectors is not None else self.index.ntotal
+
+    def add(self, vectors):
+        """:param vectors: Разреженная матрица строк; уплотняется только здесь."""
+        if self.vectors is not None:
+            raise RuntimeError("Index loaded from a snapshot is read-only.")
+        self.index.add(np.ascontiguousarray(vectors.toarray(), dtype='float32'))
+
+    def search(self, queries, k, positions=None):
+        """
+        :param positions: Если задано - искать только среди этих позиций.
+        :return: (scores, indices) формы (число запросов, k), пустые позиции заполнены -1.
+        """
+        queries = np.ascontiguousarray(queries.toarray(), dtype='float32')
+        if self.vectors is not None:
+            return self._search_vectors(queries, k, positions)
+        if positions is None:
+            return self.index.search(queries, k)
+        selector = faiss.IDSelectorBatch(np.asarray(positions, dtype='int64'))
+        return self.index.search(queries, k, params=faiss.SearchParameters(sel=selector))
+
+    def _search_vectors(self, queries, k, positions):
+        scores = np.full((queries.shape[0], k), -1, dtype=np.float32)
+        indices = np.full((queries.shape[0], k), -1, dtype=np.int64)
+        if positions is None:
+            vectors = self.vectors
+        else:
+            # Кандидатов немного, копируется только их подмножество
+            positions = np.asarray(positions, dtype=np.int64)
+            vectors = np.ascontiguousarray(self.vectors[positions])
+        top = min(k, vectors.shape[0])
+        if top == 0:
+            return scores, indices
+        found_scores, found = faiss.knn(queries, vectors, top, metric=faiss.METRIC_INNER_PRODUCT)
+        scores[:, :top] = found_scores
+        indices[:, :top] = found if positions is None else np.where(found == -1, -1, positions[found])
+        return scores, indices
+
+    def compact(self, keep):
+        """
+        :param keep: Возрастающий массив позиций, которые остаются.
+        :return: Индекс только из этих позиций, в том же порядке.
+        """
+        if self.vectors is not None:
+            # Снапшот только для чтения: живые векторы копируются в новый индекс в памяти
+            index = faiss.IndexFlatIP(self.dimension)
+            index.add(np.ascontiguousarray(self.vectors[keep], dtype='float32'))
+            return FaissIndex(self.dimension, index=index)
+        dead = np.setdiff1d(np.arange(self.index.ntotal, dtype=np.int64), keep)
+        # IndexFlat удаляет на месте и сдвигает оставшиеся векторы, сохраняя порядок
+        self.index.remove_ids(faiss.IDSelectorBatch(dead))
+        return self
+
+    def save(self, directory):
+        vectors = self.vectors if self.vectors is not None else self.index.reconstruct_n(0, self.index.ntotal)
+        np.save(os.path.join(directory, "vectors.npy"), np.asarray(vectors, dtype=np.float32).reshape(-1, self.dimension))
+
+    @classmethod
+    def load(cls, directory):
+        """Матрица векторов открывается через mmap: рабочие процессы на одном хосте делят страницы файла."""
+        vectors = np.load(os.path.join(directory, "vectors.npy"), mmap_mode='r')
+        return cls(vectors.shape[1], vectors=vectors)
+
+
+class SparseIndex:
+    """
+    Разреженный индекс: строки хранятся в CSR, запросы считаются разреженным произведением.
+
+    Память растёт с числом ненулевых элементов, а не со строками × словарь.
+    """
+
+    def __init__(self, dimension, matrix=None):
+        self.matrix = matrix if matrix is not None else sp.csr_matrix((0, dimension), dtype=np.float32)
+
+    @property
+    def dimension(self):
+        return self.matrix.shape[1]
+
+    @property
+    def ntotal(self):
+        return self.matrix.shape[0]
+
+    def add(self, vectors):
+        vectors = sp.csr_matrix(vectors, dtype=np.float32)
+        self.matrix = vectors if self.ntotal == 0 else sp.vstack([self.matrix, vectors], format='csr')
+
+    def search(self, queries, k, positions=None):
+        """
+        :param positions: Если задано - искать только среди этих позиций.
+        :return: (scores, indices) той же формы, что у FAISS; score - косинусная близость.
+        """
+        matrix = self.matrix
+        if positions is not None:
+            positions = np.asarray(positions, dtype=np.int64)
+            matrix = matrix[positions]
+
+        n_queries = queries.shape[0]
+        scores = np.full((n_queries, k), -1, dtype=np.float32)
+        indices = np.full((n_queries, k), -1, dtype=np.int64)
+        if matrix.shape[0] == 0 or k <= 0:
+            return scores, indices
+
+        # (запросы × строки) - плотным становится только этот результат, а не матрица признаков
+        similarities = (queries.astype(np.float32) @ matrix.T).toarray()
+        top = min(k, matrix.shape[0])
+        for row, query_scores in enumerate(similarities):
+            candidates = np.argpartition(-query_scores, top - 1)[:top]
+            order = candidates[np.argsort(-query_scores[candidates], kind='stable')]
+            scores[row, :top] = query_scores[order]
+            indices[row, :top] = order if positions is None else positions[order]
+        return scores, indices
+
+    def compact(self, keep):
+        """:return: Индекс только из позиций keep, в том же порядке."""
+        return SparseIndex(self.dimension, self.matrix[keep])
+
+    def save(self, directory):
+        np.save(os.path.join(directory, "data.npy"), self.matrix.data.astype(np.float32))
+        np.save(os.path.join(directory, "indices.npy"), self.matrix.indices.astype(np.int32))
+        np.save(os.path.join(directory, "indptr.npy"), self.matrix.indptr.astype(np.int64))
+        np.save(os.path.join(directory, "shape.npy"), np.asarray(self.matrix.shape, dtype=np.int64))
+
+    @classmethod
+    def load(cls, directory):
+        """Массивы CSR открываются через mmap только на чтение и не копируются в память процесса."""
+        arrays = {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r')
+                  for name in ("data", "indices", "indptr")}
+        shape = tuple(np.load(os.path.join(directory, "shape.npy")))
+        matrix = sp.csr_matrix((arrays["data"], arrays["indices"], arrays["indptr"]), shape=shape, copy=False)
+        return cls(shape[1], matrix)
+
+
+class SegmentedIndex:
+    """
+    Индекс из неизменяемой базы (снапшот, открытый через mmap) и хвоста в памяти.
+
+    Новые строки дописываются в хвост, поэтому общие страницы базы никогда не копируются.
+    """
+
+    def __init__(self, base, tail):
+        self.base = base
+        self.tail = tail
+
+    @property
+    def dimension(self):
+        return self.base.dimension
+
+    @property
+    def ntotal(self):
+        return self.base.ntotal + self.tail.ntotal
+
+    def add(self, vectors):
+        self.tail.add(vectors)
+
+    def compact(self, keep):
+        """:return: Индекс только из позиций keep; база и хвост сжимаются по отдельности."""
+        offset = self.base.ntotal
+        return SegmentedIndex(self.base.compact(keep[keep < offset]), self.tail.compact(keep[keep >= offset] - offset))
+
+    def search(self, queries, k, positions=None):
+        offset = self.base.ntotal
+        if positions is None:
+            base_positions = tail_positions = None
+        else:
+            positions = np.asarray(positions, dtype=np.int64)
+            base_positions = positions[positions < offset]
+            tail_positions = positions[positions >= offset] - offset
+
+        parts = []
+        for index, part_positions, shift in ((self.base, base_positions, 0), (self.tail, tail_positions, offset)):
+            if index.ntotal == 0 or (part_positions is not None and len(part_positions) == 0):
+                continue
+            scores, indices = index.search(queries, k, part_positions)
+            parts.append((scores, np.where(indices == -1, -1, indices + shift)))
+
+        n_queries = queries.shape[0]
+        if not parts:
+            return np.full((n_queries, k), -1, dtype=np.float32), np.full((n_queries, k), -1, dtype=np.int64)
+        scores = np.hstack([part[0] for part in parts])
+        indices = np.hstack([part[1] for part in parts])
+        # Пустые позиции уходят в конец
+        order = np.argsort(np.where(indices == -1, np.inf, -scores), axis=1, kind='stable')[:, :k]
+        return np.take_along_axis(scores, order, axis=1), np.take_along_axis(indices, order, axis=1)
+
+
+SEARCH_BACKENDS = {"faiss": FaissIndex, "sparse": SparseIndex}
+
+
 class CompetitionSearcher:
-    def __init__(self, db_url):
-        self.conn = psycopg2.connect(db_url)
-        self.cursor = self.conn.cursor()
+    def __init__(self, db, backend="faiss", max_dead_ratio=0.25):
+        """
+        :param db: Пул соединений modules.db_controller.Database.
+        :param backend: Поисковый бэкенд: "faiss" (плотный) или "sparse" (CSR без уплотнения).
+        :param max_dead_ratio: Когда мёртвых позиций становится больше этой доли индекса, он сжимается
+                               (compact); иначе поиск запрашивал бы всё больший запас k, а память росла.
+        """
+        if backend not in SEARCH_BACKENDS:
+            raise ValueError(f"Unknown search backend: {backend}")
+        self.backend = backend
+        self.max_dead_ratio = max_dead_ratio
+        self.db = db
         self.feature_vectors = None
         self.vectorizer = None
         self.index = None
         self.data = None
+        # Позиция строки в индексе -> строка (None, если строка заменена более новой версией)
+        self.rows = []
+        # id соревнования -> позиция в индексе
+        self.positions = {}
+        self.dead_count = 0
+        # Время базы, на которое прочитаны self.data; сохраняется в снапшот
+        self.fetched_at = None
+        self.lock = threading.RLock()
 
     def fetch_competitions(self):
         """Fetch competitions data from the database."""
-        self.cursor.execute("SELECT sport_name, sport_composition, ekp_number, date_start, date_end, city, discipline, competition_class, country, max_people_count, genders_and_ages FROM competitions")
-        self.data = self.cursor.fetchall()
-        # Добавьте отладочный вывод
-        print(self.data)
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT now()")
+            self.fetched_at = cursor.fetchone()[0]
+            cursor.execute(f"SELECT {', '.join(COMPETITION_COLUMNS)} FROM competitions WHERE NOT cancelled ORDER BY id")
+            self.data = cursor.fetchall()
         if not self.data:
             print("Warning: No data fetched from the database.")
         else:
             print(f"Fetched {len(self.data)} records from the database.")
 
+    @staticmethod
+    def competition_text(entry):
+        """Текст строки для TF-IDF: все колонки, кроме id."""
+        return " ".join(map(str, entry[1:]))
+
     def create_feature_vectors(self):
         """Create feature vectors using TF-IDF."""
-        combined_data = [" ".join(map(str, entry)) for entry in self.data]
+        entries = [entry for entry in self.data if self.competition_text(entry).strip()]
 
-        # Фильтрация пустых строк
-        combined_data = [text for text in combined_data if text.strip()]
-        
-        if not combined_data:
+        if not entries:
             print("Warning: No valid data for TF-IDF vectorization.")
             return
 
-        print("Combined data for TF-IDF:", combined_data)
+        # В sklearn нет встроенного русского стоп-листа, частые слова гасит IDF
+        vectorizer = TfidfVectorizer()
+        feature_vectors = vectorizer.fit_transform([self.competition_text(entry) for entry in entries])
 
-        self.vectorizer = TfidfVectorizer(stop_words='russian')  # Убедитесь, что используете нужный язык
-        self.feature_vectors = self.vectorizer.fit_transform(combined_data).toarray()
-        self.build_index() 
+        with self.lock:
+            self.vectorizer = vectorizer
+            self.feature_vectors = feature_vectors
+            self.rows = list(entries)
+            self.positions = {entry[0]: position for position, entry in enumerate(entries)}
+            self.dead_count = 0
+            self.build_index()
+            # Векторы теперь живут только в индексе
+            self.feature_vectors = None
 
     def build_index(self):
-        """Build a FAISS index for the feature vectors."""
+        """Build a search index for the feature vectors."""
         d = self.feature_vectors.shape[1]  # Dimensionality of the vectors
-        self.index = faiss.IndexFlatL2(d)  # Index for searching using Euclidean distance
-        self.index.add(np.array(self.feature_vectors).astype('float32'))  # Add vectors to the index
+        self.index = SEARCH_BACKENDS[self.backend](d)
+        self.index.add(self.feature_vectors)
 
-    def search_competitions_by_keywords(self, keywords_str: str):
-        """Search competitions based on keywords."""
+    def add_competitions(self, entries):
+        """
+        Добавляет новые или изменённые соревнования в уже построенный индекс без переобучения TF-IDF.
+
+        Слова, которых нет в словаре, при этом не учитываются; чтобы их подхватить, нужен полный
+        refresh().
+
+        :param entries: Строки в порядке COMPETITION_COLUMNS.
+        :return: Строки, которые действительно изменили индекс; совпадающие с уже проиндексированными пропускаются.
+        """
+        entries = [entry for entry in entries if self.competition_text(entry).strip()]
+        if not entries:
+            return []
+
+        with self.lock:
+            if self.vectorizer is None:
+                # Индекс ещё не построен (например, таблица была пустой) - строим с нуля
+                self.data = entries
+                self.create_feature_vectors()
+                return entries
+
+            entries = [entry for entry in entries if self.get_competition(entry[0]) != tuple(entry)]
+            if not entries:
+                return []
+
+            vectors = self.vectorizer.transform([self.competition_text(entry) for entry in entries])
+            for entry in entries:
+                old_position = self.positions.get(entry[0])
+                if old_position is not None:
+                    # Старый вектор остаётся в индексе, но помечается мёртвым и отфильтровывается при поиске
+                    self.rows[old_position] = None
+                    self.dead_count += 1
+                self.positions[entry[0]] = len(self.rows)
+                self.rows.append(entry)
+            self.index.add(vectors)
+            self._compact_if_needed()
+        return entries
+
+    def remove_competitions(self, ids):
+        """Убирает соревнования из поиска: их позиции помечаются мёртвыми."""
+        with self.lock:
+            for id_ in ids:
+                position = self.positions.pop(id_, None)
+                if position is not None:
+                    self.rows[position] = None
+                    self.dead_count += 1
+            self._compact_if_needed()
+
+    def compact(self):
+        """Убирает мёртвые позиции: в индексе остаются только векторы живых строк, позиции пересчитываются."""
+        with self.lock:
+            keep = np.asarray([position for position, row in enumerate(self.rows) if row is not None],
+                              dtype=np.int64)
+            self.index = self.index.compact(keep)
+            self.rows = [self.rows[position] for position in keep]
+            self.positions = {row[0]: position for position, row in enumerate(self.rows)}
+            self.dead_count = 0
+
+    def _compact_if_needed(self):
+        if self.index is not None and self.dead_count > self.max_dead_ratio * self.index.ntotal:
+            self.compact()
+
+    def get_competition(self, competition_id):
+        """:return: Проиндексированная строка соревнования или None."""
+        with self.lock:
+            position = self.positions.get(competition_id)
+            return None if position is None else self.rows[position]
+
+    def refresh(self):
+        """Полностью перечитывает таблицу и заново обучает TF-IDF."""
+        self.fetch_competitions()
+        self.create_feature_vectors()
+
+    def save_snapshot(self, snapshot_dir):
+        """
+        Сохраняет обученный словарь, IDF и индекс в новый каталог снапшота и атомарно
+        переключает на него ссылку snapshot_dir/current-<backend>.
+
+        Сохраняется только индекс, построенный refresh(); строки, дописанные после него,
+        догрузит из базы следующий load_snapshot().
+        """
+        with self.lock:
+            if self.index is None or isinstance(self.index, SegmentedIndex):
+                return None
+            os.makedirs(snapshot_dir, exist_ok=True)
+            name = f"{self.backend}-{time.strftime('%Y%m%d%H%M%S')}-{os.getpid()}"
+            directory = os.path.join(snapshot_dir, name)
+            os.makedirs(directory)
+
+            ids = np.asarray([row[0] if row is not None else -1 for row in self.rows], dtype=np.int64)
+            vocabulary = sorted(self.vectorizer.vocabulary_, key=self.vectorizer.vocabulary_.get)
+            self.index.save(directory)
+            np.save(os.path.join(directory, "ids.npy"), ids)
+            np.save(os.path.join(directory, "idf.npy"), self.vectorizer.idf_.astype(np.float64))
+            with open(os.path.join(directory, "vocabulary.json"), "w") as vocabulary_file:
+                json.dump(vocabulary, vocabulary_file, ensure_ascii=False)
+            meta = {
+                "version": SNAPSHOT_VERSION,
+                "backend": self.backend,
+                "max_id": int(ids.max()) if len(ids) else 0,
+                "count": int((ids != -1).sum()),
+                "created_at": time.time(),
+                # Строки, изменённые после этой метки, в снапшоте со старыми векторами
+                "fetched_at": self.fetched_at.isoformat() if self.fetched_at else None,
+            }
+            # meta.json пишется последним: каталог без него считается недописанным
+            with open(os.path.join(directory, "meta.json"), "w") as meta_file:
+                json.dump(meta, meta_file)
+
+        link = os.path.join(snapshot_dir, f"current-{self.backend}")
+        temporary_link = f"{link}.{os.getpid()}"
+        os.symlink(name, temporary_link)
+        os.replace(temporary_link, link)
+
+        # Старые снапшоты можно удалять: процессы, которые их читают, держат открытые mmap
+        for entry in os.listdir(snapshot_dir):
+            if entry.startswith(f"{self.backend}-") and entry != name:
+                self._remove_snapshot(os.path.join(snapshot_dir, entry))
+        print(f"Saved search snapshot {name} with {meta['count']} competitions.")
+        return directory
+
+    @staticmethod
+    def _remove_snapshot(directory):
+        for file_name in os.listdir(directory):
+            os.remove(os.path.join(directory, file_name))
+        os.rmdir(directory)
+
+    def load_snapshot(self, snapshot_dir, max_new_ratio=0.25):
+        """
+        Загружает снапшот и сверяет его с таблицей competitions.
+
+        Строки, удалённые из таблицы, помечаются мёртвыми; строки с id больше max_id снапшота и
+        строки, изменённые после его чтения из базы (updated_at), векторизуются заново без
+        переобучения.
+
+        :param max_new_ratio: Если новых и изменённых строк больше этой доли снапшота, словарь
+                              считается устаревшим и снапшот не используется.
+        :return: True, если снапшот загружен.
+        """
+        directory = os.path.join(snapshot_dir, f"current-{self.backend}")
+        try:
+            with open(os.path.join(directory, "meta.json")) as meta_file:
+                meta = json.load(meta_file)
+        except (OSError, ValueError):
+            return False
+        if meta.get("version") != SNAPSHOT_VERSION or meta.get("backend") != self.backend:
+            return False
+
+        if not meta.get("fetched_at"):
+            return False
+
+        # Импорт здесь: competitions_controller сам импортирует COMPETITION_COLUMNS из этого модуля
+        from modules.competitions_controller import CompetitionStore
+        self.fetch_competitions()
+        # После чтения таблицы: строка, изменённая между запросами, тоже попадёт в changed
+        changed, _, _ = CompetitionStore(self.db).changed_since(datetime.fromisoformat(meta["fetched_at"]))
+        new_entries = [entry for entry in self.data if entry[0] > meta["max_id"]]
+        changed_ids = {row[0] for row in changed if row[0] <= meta["max_id"]}
+        if len(new_entries) + len(changed_ids) > max_new_ratio * max(meta["count"], 1):
+            print(f"Search snapshot is stale: {len(new_entries)} new and {len(changed_ids)} changed competitions.")
+            return False
+
+        directory = os.path.realpath(directory)
+        with open(os.path.join(directory, "vocabulary.json")) as vocabulary_file:
+            vocabulary = json.load(vocabulary_file)
+        vectorizer = TfidfVectorizer()
+        vectorizer.vocabulary_ = {term: column for column, term in enumerate(vocabulary)}
+        vectorizer.idf_ = np.load(os.path.join(directory, "idf.npy"))
+        base = SEARCH_BACKENDS[self.backend].load(directory)
+        ids = np.load(os.path.join(directory, "ids.npy"))
+
+        entries_by_id = {entry[0]: entry for entry in self.data}
+        with self.lock:
+            self.vectorizer = vectorizer
+            self.index = SegmentedIndex(base, SEARCH_BACKENDS[self.backend](base.dimension))
+            self.rows = [entries_by_id.get(int(id_)) if id_ != -1 else None for id_ in ids]
+            self.positions = {row[0]: position for position, row in enumerate(self.rows) if row is not None}
+            self.dead_count = sum(row is None for row in self.rows)
+            # Вектор изменённой строки в снапшоте посчитан по старому тексту: позиция умирает, строка дописывается
+            changed_entries = []
+            for id_ in changed_ids:
+                position = self.positions.pop(id_, None)
+                if position is not None:
+                    changed_entries.append(self.rows[position])
+                    self.rows[position] = None
+                    self.dead_count += 1
+            self.add_competitions(new_entries + changed_entries)
+        print(f"Loaded search snapshot {os.path.basename(directory)}: {len(self.positions)} competitions, "
+              f"{len(new_entries)} added and {len(changed_entries)} re-indexed since.")
+        return True
+
+    def load_or_refresh(self, snapshot_dir):
+        """
+        Загружает актуальный снапшот или строит индекс заново и сохраняет снапшот.
+
+        Блокировка на файле не даёт нескольким рабочим процессам одновременно обучать TF-IDF:
+        первый строит и сохраняет снапшот, остальные дожидаются и загружают его.
+        """
+        os.makedirs(snapshot_dir, exist_ok=True)
+        with open(os.path.join(snapshot_dir, ".lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self.load_snapshot(snapshot_dir):
+                    return
+                self.refresh()
+                self.save_snapshot(snapshot_dir)
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @staticmethod
+    def parse_keywords(keywords_str: str):
+        """Разбивает строку ключевых слов через запятую в текст запроса."""
         keywords = [keyword.strip() for keyword in keywords_str.split(',') if keyword.strip()]
-        
-        if not keywords:
+        return " ".join(keywords)
+
+    def _rank(self, query_vectors, limit, positions=None):
+        """
+        Ищет ближайшие строки для матрицы запросов.
+
+        Равные score упорядочиваются по позиции в индексе: FAISS возвращает их в порядке, зависящем от k,
+        а k растёт с offset, поэтому без этого страницы пересекались бы и теряли строки. Если равные
+        score продолжаются за границей выборки, k увеличивается, пока граница их не покроет.
+
+        :param positions: Если задано - ранжировать только эти позиции индекса.
+        :return: Для каждого запроса список (строка, score) по убыванию score, не длиннее limit.
+        """
+        if positions is None:
+            # Запрашиваем с запасом на мёртвые позиции
+            total = self.index.ntotal
+            k = min(limit + self.dead_count, total)
+        else:
+            total = len(positions)
+            k = min(limit, total)
+
+        while True:
+            scores, indices = self.index.search(query_vectors, k, positions)
+            ranked = []
+            truncated_tie = False
+            for query_scores, query_indices in zip(scores, indices):
+                hits = sorted(((float(score), int(idx)) for score, idx in zip(query_scores, query_indices)
+                               if idx != -1 and self.rows[idx] is not None), key=lambda hit: (-hit[0], hit[1]))
+                if len(hits) >= limit > 0 and query_indices[-1] != -1 and hits[limit - 1][0] == query_scores[-1]:
+                    truncated_tie = True
+                ranked.append([(self.rows[idx], score) for score, idx in hits[:limit]])
+            if not truncated_tie or k >= total:
+                return ranked
+            k = min(2 * k, total)
+
+    def search_competitions_by_keywords(self, keywords_str: str, k=5, offset=0):
+        """
+        Search competitions based on keywords.
+
+        :param keywords_str: Ключевые слова через запятую.
+        :param k: Количество результатов на странице.
+        :param offset: Сколько лучших результатов пропустить.
+        :return: Список (строка в порядке COMPETITION_COLUMNS, score) по убыванию score.
+        """
+        query_str = self.parse_keywords(keywords_str)
+
+        if not query_str:
             print("No keywords provided for search.")
             return []
 
-        query_str = " ".join(keywords)
-        query_vector = self.vectorizer.transform([query_str]).toarray().astype('float32')
+        with self.lock:
+            if self.index is None:
+                return []
+
+            query_vector = self.vectorizer.transform([query_str])
+            # Строки берутся из памяти, без запросов к базе на каждое совпадение
+            return self._rank(query_vector, offset + k)[0][offset:]
 
-        k = 5  # Number of nearest neighbors
-        distances, indices = self.index.search(query_vector, k)
+    def search_many(self, keywords_list, k=5):
+        """
+        Пакетный поиск: все запросы векторизуются одной матрицей и ищутся одним вызовом индекса.
 
-        results = []
-        for idx in indices[0]:
-            if idx != -1:  # Check if the index is valid
-                self.cursor.execute("SELECT * FROM competitions WHERE ekp_number = %s", (self.data[idx][2],))  # Use ekp_number to get full information
-                results.append(self.cursor.fetchone())
+        :param keywords_list: Список строк ключевых слов через запятую.
+        :return: Для каждого запроса список (строка, score), как у search_competitions_by_keywords.
+        """
+        query_strs = [self.parse_keywords(keywords_str) for keywords_str in keywords_list]
+        results = [[] for _ in query_strs]
+        non_empty = [number for number, query_str in enumerate(query_strs) if query_str]
 
+        with self.lock:
+            if self.index is None or not non_empty:
+                return results
+            query_vectors = self.vectorizer.transform([query_strs[number] for number in non_empty])
+            for number, hits in zip(non_empty, self._rank(query_vectors, k)):
+                results[number] = hits
         return results
 
-    def close(self):
-        """Close the database connection."""
-        self.cursor.close()
-        self.conn.close()
+    def filter_candidates(self, filters, query_str="", limit=1000):
+        """
+        Отбирает кандидатов структурными фильтрами и полнотекстовым поиском в PostgreSQL.
+
+        :param filters: Словарь с ключами date_from, date_to, city, sport, composition, competition_class;
+                        пустые значения игнорируются.
+        :param query_str: Текст запроса; слова объединяются через ИЛИ в tsquery.
+        :param limit: Максимальное число кандидатов.
+        :return: Список id кандидатов, лучшие по ts_rank (или по дате) первыми.
+        """
+        conditions = ["NOT cancelled"]
+        values = []
+        if filters.get("date_from"):
+            conditions.append("date_start >= %s")
+            values.append(filters["date_from"])
+        if filters.get("date_to"):
+            conditions.append("date_start < %s::date + 1")
+            values.append(filters["date_to"])
+        if filters.get("city"):
+            conditions.append("lower(city) = lower(%s)")
+            values.append(filters["city"])
+        if filters.get("sport"):
+            conditions.append("lower(sport_name) = lower(%s)")
+            values.append(filters["sport"])
+        if filters.get("composition"):
+            conditions.append("sport_composition = %s")
+            values.append(filters["composition"])
+        if filters.get("competition_class"):
+            conditions.append("lower(competition_class) = lower(%s)")
+            values.append(filters["competition_class"])
+
+        words = query_str.split()
+        where = " AND ".join(conditions)
+        with self.db.cursor() as cursor:
+            if words:
+                tsquery = " || ".join(["plainto_tsquery('russian', %s)"] * len(words))
+                cursor.execute(f"""
+                    SELECT id FROM competitions
+                    WHERE {where} AND search_vector @@ ({tsquery})
+                    ORDER BY ts_rank(search_vector, {tsquery}) DESC
+                    LIMIT %s
+                """, values + words + words + [limit])
+                ids = [row[0] for row in cursor.fetchall()]
+                if ids:
+                    return ids
+                # Полнотекстовый поиск ничего не дал (даты, номера) - ранжируем всё, что прошло фильтры
+
+            cursor.execute(f"SELECT id FROM competitions WHERE {where} ORDER BY date_start LIMIT %s",
+                           values + [limit])
+            return [row[0] for row in cursor.fetchall()]
+
+    def search_filtered(self, filters, keywords_str="", k=5, offset=0, candidate_limit=1000):
+        """
+        Гибридный поиск: фильтры и полнотекстовый отбор в SQL, затем переранжирование кандидатов TF-IDF.
+
+        :return: Список (строка, score) как у search_competitions_by_keywords; без ключевых слов
+                 строки идут по дате, а score равен None.
+        """
+        query_str = self.parse_keywords(keywords_str or "")
+        candidate_ids = self.filter_candidates(filters, query_str, candidate_limit)
+
+        with self.lock:
+            positions = [self.positions[id_] for id_ in candidate_ids if id_ in self.positions]
+            if not positions:
+                return []
+            if not query_str or self.index is None:
+                return [(self.rows[position], None) for position in positions[offset:offset + k]]
+
+            query_vector = self.vectorizer.transform([query_str])
+            return self._rank(query_vector, offset + k, positions)[0][offset:]
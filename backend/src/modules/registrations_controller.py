@@ -0,0 +1,146 @@
+import psycopg2.errors
+
+REGISTRATION_STATUSES = ("registered", "waitlisted")
+
+
+class EventNotFound(LookupError):
+    """Соревнования с таким id нет."""
+
+
+class UserNotFound(LookupError):
+    """Пользователя с таким id нет."""
+
+
+class EventClosed(Exception):
+    """Соревнование отменено, регистрация закрыта."""
+
+
+class RegistrationStore:
+    def __init__(self, db):
+        """
+        Регистрации пользователей на соревнования и лист ожидания.
+
+        Вместимость проверяет условный UPDATE счётчика competitions.registered_count: место занимает
+        только тот, чей UPDATE прошёл проверку registered_count < max_people_count, а блокировка строки
+        на время UPDATE не даёт двум транзакциям занять одно и то же место. Блокировка держится от
+        UPDATE до COMMIT, поэтому счётчик меняется последним оператором транзакции. Повторная
+        регистрация отсекается первичным ключом (competition_id, user_id).
+
+        :param db: Пул соединений Database.
+        """
+        self.db = db
+
+    def register(self, competition_id, user_id):
+        """
+        Регистрирует пользователя или ставит его в лист ожидания, если мест нет.
+
+        :return: (статус, True - если регистрация новая). Для существующей регистрации возвращается
+                 её текущий статус.
+        :raises EventNotFound, UserNotFound, EventClosed:
+        """
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT cancelled FROM competitions WHERE id = %s", (competition_id,))
+            event = cursor.fetchone()
+            if event is None:
+                raise EventNotFound(f"Event {competition_id} not found.")
+            if event[0]:
+                raise EventClosed(f"Event {competition_id} is cancelled.")
+
+            try:
+                cursor.execute("""
+                    INSERT INTO event_registrations (competition_id, user_id, status)
+                    VALUES (%s, %s, 'registered')
+                    ON CONFLICT (competition_id, user_id) DO NOTHING
+                """, (competition_id, user_id))
+            except psycopg2.errors.ForeignKeyViolation:
+                raise UserNotFound(f"User {user_id} not found.")
+            if cursor.rowcount == 0:
+                cursor.execute("SELECT status FROM event_registrations WHERE competition_id = %s AND user_id = %s",
+                               (competition_id, user_id))
+                return cursor.fetchone()[0], False
+
+            # Быстрый путь: место есть, строка соревнования блокируется только до COMMIT
+            if self._take_seat(cursor, competition_id):
+                return "registered", True
+
+            # Мест нет. Под блокировкой строки проверяем ещё раз: между UPDATE и этой точкой место могла
+            # освободить отмена регистрации, которая берёт ту же блокировку перед выбором из листа ожидания
+            cursor.execute("SELECT 1 FROM competitions WHERE id = %s FOR NO KEY UPDATE", (competition_id,))
+            if self._take_seat(cursor, competition_id):
+                return "registered", True
+            cursor.execute("""
+                UPDATE event_registrations SET status = 'waitlisted'
+                WHERE competition_id = %s AND user_id = %s
+            """, (competition_id, user_id))
+            return "waitlisted", True
+
+    @staticmethod
+    def _take_seat(cursor, competition_id):
+        cursor.execute("""
+            UPDATE competitions SET registered_count = registered_count + 1
+            WHERE id = %s AND (max_people_count IS NULL OR registered_count < max_people_count)
+        """, (competition_id,))
+        return cursor.rowcount == 1
+
+    def unregister(self, competition_id, user_id):
+        """
+        Отменяет регистрацию; освободившееся место получает первый из листа ожидания.
+
+        :return: (прежний статус или None, если регистрации не было; id переведённого из листа ожидания или None).
+        """
+        with self.db.cursor() as cursor:
+            # Та же блокировка, что у медленного пути register(): лист ожидания не пополняется, пока мы выбираем
+            cursor.execute("SELECT 1 FROM competitions WHERE id = %s FOR NO KEY UPDATE", (competition_id,))
+            cursor.execute("""
+                DELETE FROM event_registrations WHERE competition_id = %s AND user_id = %s
+                RETURNING status
+            """, (competition_id, user_id))
+            deleted = cursor.fetchone()
+            if deleted is None or deleted[0] != "registered":
+                return (deleted[0] if deleted else None), None
+
+            cursor.execute("""
+                UPDATE event_registrations SET status = 'registered'
+                WHERE (competition_id, user_id) = (
+                    SELECT competition_id, user_id FROM event_registrations
+                    WHERE competition_id = %s AND status = 'waitlisted'
+                    ORDER BY created_at, user_id
+                    LIMIT 1
+                )
+                RETURNING user_id
+            """, (competition_id,))
+            promoted = cursor.fetchone()
+            if promoted is None:
+                cursor.execute("UPDATE competitions SET registered_count = registered_count - 1 WHERE id = %s",
+                               (competition_id,))
+                return "registered", None
+            return "registered", promoted[0]
+
+    def waitlist_position(self, competition_id, user_id):
+        """:return: Место в листе ожидания, начиная с 1, или None."""
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT count(*) FROM event_registrations waiting
+                JOIN event_registrations mine ON mine.competition_id = waiting.competition_id
+                WHERE mine.competition_id = %s AND mine.user_id = %s AND mine.status = 'waitlisted'
+                  AND waiting.status = 'waitlisted'
+                  AND (waiting.created_at, waiting.user_id) <= (mine.created_at, mine.user_id)
+            """, (competition_id, user_id))
+            position = cursor.fetchone()[0]
+        return position or None
+
+    def summary(self, competition_id):
+        """
+        :return: {"capacity", "registered", "waitlisted"} или None, если соревнования нет.
+        """
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT max_people_count, registered_count,
+                       (SELECT count(*) FROM event_registrations
+                        WHERE competition_id = competitions.id AND status = 'waitlisted')
+                FROM competitions WHERE id = %s
+            """, (competition_id,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        return {"capacity": row[0], "registered": row[1], "waitlisted": row[2]}
@@ -0,0 +1,232 @@
+"""Схема базы данных CMSE. Все операторы идемпотентны и выполняются при каждом старте."""
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS users (
+    id SERIAL PRIMARY KEY,
+    username VARCHAR(50) UNIQUE NOT NULL,
+    email VARCHAR(100) UNIQUE NOT NULL,
+    phone VARCHAR(20),
+    name VARCHAR(100),
+    description TEXT,
+    avatar TEXT,  -- Хеш изображения в MediaStore (modules.media_controller) или внешний URL
+    birth DATE,
+    city VARCHAR(100),
+    sports VARCHAR(255)[],  -- Массив видов спорта
+    events INTEGER[],  -- Массив ID соревнований
+    password VARCHAR(255) NOT NULL,  -- Хешированный пароль
+    root BOOLEAN DEFAULT false,
+    admin BOOLEAN DEFAULT false,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    last_login TIMESTAMP WITH TIME ZONE
+);
+
+CREATE TABLE IF NOT EXISTS competitions (
+    id SERIAL PRIMARY KEY,
+    sport_name VARCHAR(255),
+    sport_composition VARCHAR(255),
+    ekp_number VARCHAR(255) UNIQUE,
+    date_start TIMESTAMP,
+    date_end TIMESTAMP,
+    city VARCHAR(255),
+    discipline VARCHAR(255),
+    competition_class VARCHAR(255),
+    country VARCHAR(255),
+    max_people_count INTEGER,
+    peoples INTEGER[],  -- Список ID людей
+    genders_and_ages VARCHAR[],  -- Массив для гендеров и возрастов
+    comments JSONB[]  -- Массив для комментариев в формате JSON
+);
+
+-- Индексы для улучшения производительности
+CREATE INDEX IF NOT EXISTS idx_users_username ON users(username);
+CREATE INDEX IF NOT EXISTS idx_users_email ON users(email);
+-- Поиск пользователей (UserManager.find_users): город со страницами по id и операторы @>, && по видам спорта
+CREATE INDEX IF NOT EXISTS idx_users_city_id ON users(city, id);
+CREATE INDEX IF NOT EXISTS idx_users_sports ON users USING GIN (sports);
+CREATE INDEX IF NOT EXISTS idx_competitions_sport_name ON competitions(sport_name);
+CREATE INDEX IF NOT EXISTS idx_competitions_ekp_number ON competitions(ekp_number);
+
+-- Полнотекстовый поиск и структурные фильтры для /get_events
+ALTER TABLE competitions ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('russian',
+        coalesce(sport_name, '') || ' ' || coalesce(sport_composition, '') || ' ' ||
+        coalesce(city, '') || ' ' || coalesce(discipline, '') || ' ' ||
+        coalesce(competition_class, '') || ' ' || coalesce(country, ''))) STORED;
+CREATE INDEX IF NOT EXISTS idx_competitions_search_vector ON competitions USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS idx_competitions_date_start ON competitions(date_start);
+CREATE INDEX IF NOT EXISTS idx_competitions_city_lower ON competitions(lower(city));
+CREATE INDEX IF NOT EXISTS idx_competitions_sport_name_lower ON competitions(lower(sport_name));
+
+-- Время последнего изменения строки при повторной загрузке календаря
+ALTER TABLE competitions ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP;
+CREATE INDEX IF NOT EXISTS idx_competitions_updated_at ON competitions(updated_at);
+-- Соревнование пропало из новой редакции календаря; строка остаётся ради регистраций и комментариев
+ALTER TABLE competitions ADD COLUMN IF NOT EXISTS cancelled BOOLEAN NOT NULL DEFAULT false;
+
+-- Загруженные PDF и хеши их страниц для повторной загрузки новых редакций календаря
+CREATE TABLE IF NOT EXISTS pdf_files (
+    id SERIAL PRIMARY KEY,
+    sha256 CHAR(64) UNIQUE NOT NULL,
+    filename VARCHAR(255),
+    page_count INTEGER,
+    ekp_numbers VARCHAR(255)[],  -- Номера ЕКП, найденные в файле
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP,
+    ingested_at TIMESTAMP WITH TIME ZONE
+);
+
+CREATE TABLE IF NOT EXISTS pdf_pages (
+    file_id INTEGER REFERENCES pdf_files(id) ON DELETE CASCADE,
+    page_number INTEGER,
+    page_hash CHAR(64) NOT NULL,
+    PRIMARY KEY (file_id, page_number)
+);
+CREATE INDEX IF NOT EXISTS idx_pdf_pages_page_hash ON pdf_pages(page_hash);
+
+-- Разобранные строки страницы по хешу её содержимого и параметрам парсера
+CREATE TABLE IF NOT EXISTS pdf_page_lines (
+    page_hash CHAR(64),
+    layout_key VARCHAR(64),
+    lines TEXT[],
+    sport_names TEXT[],
+    PRIMARY KEY (page_hash, layout_key)
+);
+
+-- Регистрации на соревнования: одна строка на пару (соревнование, пользователь) вместо массивов
+-- competitions.peoples и users.events. registered_count - число мест, занятых status = 'registered';
+-- его условный UPDATE и есть проверка вместимости
+CREATE TABLE IF NOT EXISTS event_registrations (
+    competition_id INTEGER REFERENCES competitions(id) ON DELETE CASCADE,
+    user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+    status VARCHAR(16) NOT NULL,  -- registered или waitlisted
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp(),
+    PRIMARY KEY (competition_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_event_registrations_user_id ON event_registrations(user_id);
+CREATE INDEX IF NOT EXISTS idx_event_registrations_waitlist ON event_registrations(competition_id, created_at)
+    WHERE status = 'waitlisted';
+
+-- Однократный перенос старых массивов peoples при появлении счётчика
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'competitions' AND column_name = 'registered_count') THEN
+        ALTER TABLE competitions ADD COLUMN registered_count INTEGER NOT NULL DEFAULT 0;
+        INSERT INTO event_registrations (competition_id, user_id, status)
+            SELECT DISTINCT competitions.id, users.id, 'registered'
+            FROM competitions CROSS JOIN unnest(competitions.peoples) AS people(user_id)
+            JOIN users ON users.id = people.user_id
+            ON CONFLICT DO NOTHING;
+        UPDATE competitions SET registered_count = registered.count
+        FROM (SELECT competition_id, count(*) AS count FROM event_registrations
+              WHERE status = 'registered' GROUP BY competition_id) registered
+        WHERE registered.competition_id = competitions.id;
+    END IF;
+END
+$$;
+
+-- Комментарии к соревнованиям отдельными строками вместо массива competitions.comments;
+-- rating_count и rating_sum обновляются вместе с каждой вставкой и удалением комментария
+CREATE TABLE IF NOT EXISTS event_comments (
+    id BIGSERIAL PRIMARY KEY,
+    competition_id INTEGER NOT NULL REFERENCES competitions(id) ON DELETE CASCADE,
+    user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+    rate SMALLINT NOT NULL CHECK (rate BETWEEN 0 AND 5),
+    text TEXT,
+    images TEXT[] NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT CURRENT_TIMESTAMP
+);
+-- Страницы комментариев по ключу (competition_id, id) от новых к старым
+CREATE INDEX IF NOT EXISTS idx_event_comments_competition_id ON event_comments(competition_id, id DESC);
+
+-- Однократный перенос старых комментариев при появлении счётчиков рейтинга
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM information_schema.columns
+                   WHERE table_name = 'competitions' AND column_name = 'rating_count') THEN
+        ALTER TABLE competitions ADD COLUMN rating_count INTEGER NOT NULL DEFAULT 0;
+        ALTER TABLE competitions ADD COLUMN rating_sum INTEGER NOT NULL DEFAULT 0;
+        INSERT INTO event_comments (competition_id, user_id, rate, text, images)
+            SELECT competitions.id, users.id, (comment->>'rate')::SMALLINT, comment->>'text',
+                   ARRAY(SELECT jsonb_array_elements_text(coalesce(comment->'images', '[]')))
+            FROM competitions CROSS JOIN unnest(competitions.comments) AS comment
+            LEFT JOIN users ON users.id = (comment->>'user_id')::INTEGER
+            WHERE (comment->>'rate')::SMALLINT BETWEEN 0 AND 5;
+        UPDATE competitions SET rating_count = rated.count, rating_sum = rated.sum
+        FROM (SELECT competition_id, count(*) AS count, sum(rate) AS sum FROM event_comments
+              GROUP BY competition_id) rated
+        WHERE rated.competition_id = competitions.id;
+    END IF;
+END
+$$;
+
+-- Лента изменений (modules.notify_controller): после фиксации транзакции id изменённых строк уходят
+-- в канал NOTIFY, указанный аргументом триггера. Триггеры уровня оператора: пачка из execute_values
+-- даёт одно уведомление на 500 id, а не по одному на строку. UPDATE только колонок из ignored,
+-- которые не интересны подписчикам, уведомления не шлёт
+CREATE OR REPLACE FUNCTION notify_row_changes() RETURNS trigger AS $$
+DECLARE
+    ids INTEGER[];
+    ignored TEXT[] := CASE TG_TABLE_NAME
+        WHEN 'competitions' THEN ARRAY['peoples', 'comments', 'updated_at', 'search_vector', 'registered_count',
+                                       'rating_count', 'rating_sum']
+        ELSE ARRAY[]::TEXT[]
+    END;
+    batch_size CONSTANT INTEGER := 500;
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(id ORDER BY id) INTO ids FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(id ORDER BY id) INTO ids FROM old_rows;
+    ELSE
+        SELECT array_agg(new_row.id ORDER BY new_row.id) INTO ids
+        FROM new_rows new_row JOIN old_rows old_row ON old_row.id = new_row.id
+        WHERE to_jsonb(new_row) - ignored IS DISTINCT FROM to_jsonb(old_row) - ignored;
+    END IF;
+    IF ids IS NULL THEN
+        RETURN NULL;
+    END IF;
+    -- Размер payload NOTIFY ограничен 8000 байт
+    FOR batch_start IN 1 .. array_length(ids, 1) BY batch_size LOOP
+        PERFORM pg_notify(TG_ARGV[0], json_build_object(
+            'op', lower(TG_OP), 'ids', ids[batch_start:batch_start + batch_size - 1])::text);
+    END LOOP;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql;
+
+-- Изменения users в ленту не публикуются; триггеры, созданные прежней версией схемы, удаляются
+DROP TRIGGER IF EXISTS users_notify_insert ON users;
+DROP TRIGGER IF EXISTS users_notify_update ON users;
+DROP TRIGGER IF EXISTS users_notify_delete ON users;
+
+-- CREATE OR REPLACE TRIGGER появился только в PostgreSQL 14
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'competitions_notify_insert') THEN
+        CREATE TRIGGER competitions_notify_insert AFTER INSERT ON competitions
+            REFERENCING NEW TABLE AS new_rows FOR EACH STATEMENT
+            EXECUTE FUNCTION notify_row_changes('competitions_changed');
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'competitions_notify_update') THEN
+        CREATE TRIGGER competitions_notify_update AFTER UPDATE ON competitions
+            REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows FOR EACH STATEMENT
+            EXECUTE FUNCTION notify_row_changes('competitions_changed');
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_trigger WHERE tgname = 'competitions_notify_delete') THEN
+        CREATE TRIGGER competitions_notify_delete AFTER DELETE ON competitions
+            REFERENCING OLD TABLE AS old_rows FOR EACH STATEMENT
+            EXECUTE FUNCTION notify_row_changes('competitions_changed');
+    END IF;
+END
+$$;
+"""
+
+
+def create_schema(conn):
+    """Создаёт таблицы и индексы, если их ещё нет."""
+    with conn.cursor() as cursor:
+        # Рабочие процессы API и исполнитель загрузки стартуют одновременно; проверки IF NOT EXISTS
+        # не защищают от гонки, поэтому схема создаётся по очереди
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('cmse_schema'))")
+        cursor.execute(SCHEMA_SQL)
+    conn.commit()
@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import hmac
+import secrets
+import time
+import redis
+
+
+class SessionStore:
+    SESSION_KEY = "session:{}"
+    USER_SESSIONS_KEY = "user_sessions:{}"
+    SECRET_KEY = "session:secret"
+
+    def __init__(self, host, port=6379, ttl=7 * 24 * 3600, secret=None):
+        """
+        Сессии пользователей в Redis.
+
+        Токен - "<id сессии>.<срок действия>.<подпись HMAC-SHA256>". Подпись и срок проверяются без
+        обращений куда-либо, поэтому поддельный или просроченный токен отклоняется сразу; для
+        настоящего остаётся один HGETALL - удалённая из Redis сессия отозвана. Ни PostgreSQL, ни
+        bcrypt при проверке не участвуют.
+
+        :param host: Хост Redis.
+        :param port: Порт Redis (по умолчанию 6379).
+        :param ttl: Время жизни сессии в секундах (по умолчанию 7 дней).
+        :param secret: Ключ подписи. Если не задан, все процессы берут общий случайный ключ из Redis.
+        """
+        self.redis = redis.Redis(host=host, port=port, socket_timeout=0.5, socket_connect_timeout=0.5,
+                                 decode_responses=True)
+        self.ttl = ttl
+        self._secret = secret.encode('utf-8') if secret else None
+
+    @property
+    def secret(self):
+        if self._secret is None:
+            # Первый процесс записывает ключ, остальные читают его
+            self.redis.set(self.SECRET_KEY, secrets.token_hex(32), nx=True)
+            self._secret = self.redis.get(self.SECRET_KEY).encode('utf-8')
+        return self._secret
+
+    def _sign(self, payload):
+        digest = hmac.new(self.secret, payload.encode('utf-8'), hashlib.sha256).digest()
+        return base64.urlsafe_b64encode(digest).rstrip(b"=").decode('ascii')
+
+    def issue(self, user_id, username, admin=False, root=False):
+        """
+        Создаёт сессию.
+
+        :return: (токен, срок действия - unix time).
+        """
+        session_id = secrets.token_urlsafe(18)
+        expires_at = int(time.time()) + self.ttl
+        user_sessions = self.USER_SESSIONS_KEY.format(user_id)
+        pipeline = self.redis.pipeline()
+        pipeline.hset(self.SESSION_KEY.format(session_id), mapping={
+            "user_id": user_id, "username": username, "admin": int(bool(admin)), "root": int(bool(root)),
+            "expires_at": expires_at,
+        })
+        pipeline.expireat(self.SESSION_KEY.format(session_id), expires_at)
+        # Список сессий пользователя - чтобы отозвать их все при удалении пользователя
+        pipeline.sadd(user_sessions, session_id)
+        pipeline.expire(user_sessions, self.ttl)
+        pipeline.execute()
+        payload = f"{session_id}.{expires_at}"
+        return f"{payload}.{self._sign(payload)}", expires_at
+
+    def parse(self, token):
+        """:return: id сессии из токена с верной подписью и не истёкшим сроком или None."""
+        parts = token.split(".")
+        if len(parts) != 3 or not parts[1].isdigit():
+            return None
+        session_id, expires_at, signature = parts
+        if not hmac.compare_digest(signature, self._sign(f"{session_id}.{expires_at}")):
+            return None
+        if int(expires_at) <= time.time():
+            return None
+        return session_id
+
+    def validate(self, token):
+        """
+        :return: Сессия (user_id, username, admin, root, expires_at, session_id) или None.
+        :raises redis.RedisError: Redis недоступен.
+        """
+        session_id = self.parse(token)
+        if session_id is None:
+            return None
+        session = self.redis.hgetall(self.SESSION_KEY.format(session_id))
+        if not session:
+            return None
+        return {
+            "session_id": session_id,
+            "user_id": int(session["user_id"]),
+            "username": session["username"],
+            "admin": session["admin"] == "1",
+            "root": session["root"] == "1",
+            "expires_at": int(session["expires_at"]),
+        }
+
+    def revoke(self, session):
+        """:param session: Сессия из validate()."""
+        pipeline = self.redis.pipeline()
+        pipeline.delete(self.SESSION_KEY.format(session["session_id"]))
+        pipeline.srem(self.USER_SESSIONS_KEY.format(session["user_id"]), session["session_id"])
+        pipeline.execute()
+
+    def revoke_user(self, user_id):
+        """Отзывает все сессии пользователя."""
+        user_sessions = self.USER_SESSIONS_KEY.format(user_id)
+        session_ids = self.redis.smembers(user_sessions)
+        pipeline = self.redis.pipeline()
+        for session_id in session_ids:
+            pipeline.delete(self.SESSION_KEY.format(session_id))
+        pipeline.delete(user_sessions)
+        pipeline.execute()
+        return len(session_ids)
@@ -0,0 +1,203 @@
+import threading
+from collections import Counter
+from modules.rag_controller import COMPETITION_COLUMNS
+
+SUGGEST_FIELDS = ("sport_name", "city", "discipline", "competition_class")
+
+
+def normalize(value):
+    """Нормализация для сравнения: регистр, ё/е, дефисы и лишние пробелы не важны."""
+    return " ".join(str(value).lower().replace("ё", "е").replace("-", " ").split())
+
+
+class _TrieNode:
+    __slots__ = ("children", "term", "best")
+
+    def __init__(self):
+        self.children = {}
+        # Нормализованное значение, которое заканчивается в этом узле
+        self.term = None
+        # Самые популярные значения поддерева: список (count, term) по убыванию
+        self.best = []
+
+
+class SuggestIndex:
+    def __init__(self, fields=SUGGEST_FIELDS, top_size=50):
+        """
+        Префиксный индекс подсказок в памяти с допуском опечаток.
+
+        Для каждого поля строится префиксное дерево по нормализованным значениям; в каждом узле
+        хранится top_size самых популярных значений поддерева, поэтому дополнение префикса не
+        требует обхода всего поддерева. Популярность - число соревнований с этим значением.
+
+        :param fields: Поля соревнований, по которым строятся подсказки.
+        :param top_size: Сколько популярных значений хранить в каждом узле (по умолчанию 50); больше
+                         top_size подсказок suggest() не возвращает.
+        """
+        self.fields = fields
+        self.top_size = top_size
+        self.columns = {field: COMPETITION_COLUMNS.index(field) for field in fields}
+        self.lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.roots = {field: _TrieNode() for field in self.fields}
+        # (поле, нормализованное значение) -> [отображаемое значение, count]
+        self.counts = {}
+        # id соревнования -> значения полей, чтобы обновление строки не считалось дважды
+        self.values_by_id = {}
+
+    def rebuild(self, entries):
+        """
+        Строит индекс заново по строкам в порядке COMPETITION_COLUMNS.
+
+        Сначала значения подсчитываются, затем каждое различное значение вставляется в дерево один
+        раз, а top узлов считается одним обходом снизу вверх: время зависит от числа различных
+        значений, а не строк.
+        """
+        with self.lock:
+            self._reset()
+            raw_counts = Counter()
+            for entry in entries:
+                values = {field: entry[column] for field, column in self.columns.items() if entry[column]}
+                self.values_by_id[entry[0]] = values
+                raw_counts.update(values.items())
+
+            # Отображаемым остаётся первое встреченное написание, как при добавлении по одной строке
+            for (field, value), count in raw_counts.items():
+                term = normalize(value)
+                if term:
+                    self.counts.setdefault((field, term), [str(value).strip(), 0])[1] += count
+
+            for field, term in self.counts:
+                node = self.roots[field]
+                for char in term:
+                    node = node.children.setdefault(char, _TrieNode())
+                node.term = term
+            for field, root in self.roots.items():
+                # Обратный порядок обхода в глубину: каждый узел после всех своих потомков
+                nodes, stack = [], [root]
+                while stack:
+                    node = stack.pop()
+                    nodes.append(node)
+                    stack.extend(node.children.values())
+                for node in reversed(nodes):
+                    self._update_best(field, node)
+
+    def add_competitions(self, entries):
+        """Добавляет новые или изменённые соревнования; для изменённых старые значения вычитаются."""
+        with self.lock:
+            for entry in entries:
+                self._remove_values(entry[0])
+                values = {field: entry[column] for field, column in self.columns.items() if entry[column]}
+                self.values_by_id[entry[0]] = values
+                for field, value in values.items():
+                    self._change_count(field, value, 1)
+
+    def remove_competitions(self, ids):
+        with self.lock:
+            for id_ in ids:
+                self._remove_values(id_)
+
+    def _remove_values(self, id_):
+        for field, value in self.values_by_id.pop(id_, {}).items():
+            self._change_count(field, value, -1)
+
+    def _change_count(self, field, value, delta):
+        term = normalize(value)
+        if not term:
+            return
+        record = self.counts.setdefault((field, term), [str(value).strip(), 0])
+        record[1] += delta
+        if record[1] <= 0:
+            del self.counts[(field, term)]
+
+        # Спускаемся по дереву, затем пересчитываем top поднимаясь обратно
+        path = [self.roots[field]]
+        for char in term:
+            path.append(path[-1].children.setdefault(char, _TrieNode()))
+        path[-1].term = term if (field, term) in self.counts else None
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            self._update_best(field, node)
+            if depth and not node.best and not node.children:
+                del path[depth - 1].children[term[depth - 1]]
+
+    def _update_best(self, field, node):
+        """Пересчитывает top узла по его значению и top детей."""
+        candidates = [] if node.term is None else [(self.counts[(field, node.term)][1], node.term)]
+        for child in node.children.values():
+            candidates.extend(child.best)
+        node.best = sorted(candidates, key=lambda item: (-item[0], item[1]))[:self.top_size]
+
+    @staticmethod
+    def max_typos(length):
+        """Допустимое число опечаток в зависимости от длины введённого префикса."""
+        if length < 3:
+            return 0
+        return 1 if length < 6 else 2
+
+    def _search_field(self, field, query, max_distance):
+        """
+        Обходит дерево, считая расстояние Левенштейна от запроса до префикса в каждом узле.
+
+        :return: Словарь term -> минимальное расстояние для значений, чей префикс совпадает
+                 с запросом с точностью до max_distance правок.
+        """
+        matches = {}
+        first_row = list(range(len(query) + 1))
+        stack = [(self.roots[field], first_row)]
+        while stack:
+            node, row = stack.pop()
+            if row[-1] <= max_distance:
+                for _, term in node.best:
+                    if row[-1] < matches.get(term, max_distance + 1):
+                        matches[term] = row[-1]
+            if min(row) >= max_distance and row[-1] <= max_distance:
+                # Ниже расстояние уже не уменьшится
+                continue
+            for char, child in node.children.items():
+                next_row = [row[0] + 1]
+                for column in range(1, len(query) + 1):
+                    next_row.append(min(next_row[column - 1] + 1, row[column] + 1,
+                                        row[column - 1] + (query[column - 1] != char)))
+                if min(next_row) <= max_distance:
+                    stack.append((child, next_row))
+        return matches
+
+    def suggest(self, prefix, field=None, limit=10):
+        """
+        Подсказки по префиксу.
+
+        :param prefix: Введённый текст.
+        :param field: Одно из полей индекса или None для всех.
+        :param limit: Максимальное число подсказок; не больше top_size.
+        :return: Список словарей value/field/count/distance: сначала точные совпадения префикса,
+                 затем с опечатками, внутри - по популярности.
+        """
+        query = normalize(prefix)
+        if not query:
+            return []
+        # Точных дополнений в узле хранится не больше top_size
+        limit = min(limit, self.top_size)
+        fields = [field] if field else self.fields
+        max_distance = self.max_typos(len(query))
+
+        suggestions = []
+        with self.lock:
+            # Обход с опечатками дороже, поэтому он нужен, только если точных совпадений не хватило
+            for distance_limit in sorted({0, max_distance}):
+                matches = {field_name: self._search_field(field_name, query, distance_limit) for field_name in fields}
+                if sum(map(len, matches.values())) >= limit:
+                    break
+            for field_name, terms in matches.items():
+                for term, distance in terms.items():
+                    value, count = self.counts[(field_name, term)]
+                    suggestions.append({"value": value, "field": field_name, "count": count, "distance": distance})
+        suggestions.sort(key=lambda item: (item["distance"], -item["count"], item["value"]))
+        return suggestions[:limit]
+
+    def values(self, field):
+        """Все различные значения поля в алфавитном порядке."""
+        with self.lock:
+            return sorted(value for (field_name, _), (value, _) in self.counts.items() if field_name == field)
@@ -0,0 +1,43 @@
+import hashlib
+import os
+import tempfile
+
+
+class UploadTooLarge(Exception):
+    """Загружаемый файл превысил допустимый размер."""
+
+
+class UploadWriter:
+    def __init__(self, directory, max_bytes=None, suffix=""):
+        """
+        Загружаемый файл, который пишется на диск порциями; SHA-256 считается на лету.
+
+        Имя файла уникально (mkstemp), поэтому одновременные загрузки с одинаковым именем не
+        перезаписывают друг друга, а память на загрузку не зависит от размера файла.
+
+        :param directory: Каталог, в который пишется файл.
+        :param max_bytes: Максимальный размер файла; None - без ограничения.
+        :param suffix: Расширение временного файла.
+        """
+        fd, self.path = tempfile.mkstemp(dir=directory, suffix=suffix)
+        self.file = os.fdopen(fd, "wb")
+        self.digest = hashlib.sha256()
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {self.max_bytes} bytes.")
+        self.digest.update(chunk)
+        self.file.write(chunk)
+
+    def close(self):
+        """:return: SHA-256 записанного файла."""
+        self.file.close()
+        return self.digest.hexdigest()
+
+    def discard(self):
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
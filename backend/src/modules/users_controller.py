@@ -1,33 +1,147 @@
+import asyncio
 import os
-import psycopg2
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import bcrypt
-from datetime import date
+
+
+class HasherBusy(Exception):
+    """Очередь хеширования паролей переполнена."""
+
+
+class PasswordHasher:
+    def __init__(self, rounds=12, workers=None, max_queue=64):
+        """
+        bcrypt в отдельном ограниченном пуле потоков.
+
+        Один хеш стоит 100-300 мс процессора. bcrypt отпускает GIL, поэтому отдельные потоки не мешают
+        циклу событий и остальным обработчикам, а размер пула ограничивает, сколько ядер уходит на пароли.
+        Если в работе и в очереди уже workers + max_queue операций, новые сразу отклоняются HasherBusy,
+        а не ждут секунды в общей очереди.
+
+        :param rounds: Стоимость bcrypt (log2 числа раундов, по умолчанию 12). Хеши с другой стоимостью
+                       пересчитываются при следующем входе.
+        :param workers: Число потоков хеширования (по умолчанию - число ядер).
+        :param max_queue: Сколько операций может ждать свободного потока (по умолчанию 64).
+        """
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 1
+        self.limit = self.workers + max_queue
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self.lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _hash_bytes(hashed):
+        # Раньше bytes из hashpw попадали в VARCHAR как bytea: '\x2432622431...'
+        if hashed.startswith("\\x"):
+            return bytes.fromhex(hashed[2:])
+        return hashed.encode('utf-8')
+
+    def hash_sync(self, password):
+        """Хеш пароля строкой, как он хранится в users.password."""
+        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(self.rounds)).decode('ascii')
+
+    def verify_sync(self, password, hashed):
+        try:
+            return bcrypt.checkpw(password.encode('utf-8'), self._hash_bytes(hashed))
+        except ValueError:
+            # Не хеш bcrypt
+            return False
+
+    def needs_rehash(self, hashed):
+        """Хеш в старом формате (bytea-hex) или с другой стоимостью."""
+        if isinstance(hashed, str) and hashed.startswith("\\x"):
+            return True
+        hashed = self._hash_bytes(hashed)
+        return hashed[:4] not in (b"$2b$", b"$2a$", b"$2y$") or int(hashed[4:6]) != self.rounds
+
+    async def submit(self, function, *args):
+        with self.lock:
+            if self.pending >= self.limit:
+                self.rejected += 1
+                raise HasherBusy(f"{self.pending} password hashing operations already in progress.")
+            self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            with self.lock:
+                self.pending -= 1
+                self.completed += 1
+
+    async def hash(self, password):
+        return await self.submit(self.hash_sync, password)
+
+    async def verify(self, password, hashed):
+        return await self.submit(self.verify_sync, password, hashed)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "rounds": self.rounds,
+                "workers": self.workers,
+                "limit": self.limit,
+                "pending": self.pending,
+                "completed_total": self.completed,
+                "rejected_total": self.rejected,
+            }
+
+
+# Публичные поля пользователя в результатах find_users
+USER_SEARCH_COLUMNS = ["id", "username", "name", "city", "sports", "avatar"]
+
 
 class UserManager:
-    def __init__(self, db_url):
-        self.conn = psycopg2.connect(db_url)
-        self.cursor = self.conn.cursor()
+    def __init__(self, db, hasher=None):
+        """
+        :param db: Пул соединений modules.db_controller.Database.
+        :param hasher: PasswordHasher (по умолчанию - со стоимостью 12).
+        """
+        self.db = db
+        self.hasher = hasher or PasswordHasher()
 
     def hash_password(self, password):
         """Hashes a password using bcrypt."""
-        return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+        return self.hasher.hash_sync(password)
 
     def verify_password(self, password, hashed):
         """Verifies a password against a hashed password."""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed)
+        return self.hasher.verify_sync(password, hashed)
 
-    def register_user(self, username, email, phone, name, description, avatar, birth, city, sports, events, password, root=False, admin=False):
-        try:
-            hashed_password = self.hash_password(password)
-            self.cursor.execute("""
+    def create_user(self, username, email, phone, name, description, avatar, birth, city, sports, events, password_hash, root=False, admin=False):
+        """Inserts a user with an already hashed password; errors are raised to the caller."""
+        with self.db.cursor() as cursor:
+            cursor.execute("""
                 INSERT INTO users (username, email, phone, name, description, avatar, birth, city, sports, events, password, root, admin)
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """, (username, email, phone, name, description, avatar, birth, city, sports, events, hashed_password, root, admin))
-            self.conn.commit()
+            """, (username, email, phone, name, description, avatar, birth, city, sports, events, password_hash, root, admin))
+
+    def register_user(self, username, email, phone, name, description, avatar, birth, city, sports, events, password, root=False, admin=False):
+        try:
+            self.create_user(username, email, phone, name, description, avatar, birth, city, sports, events,
+                             self.hash_password(password), root, admin)
             print("User  registered successfully.")
         except Exception as e:
             print(f"Error registering user: {str(e)}")
-            self.conn.rollback()
+
+    def get_credentials(self, username):
+        """:return: (id, хеш пароля, admin, root) или None."""
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT id, password, admin, root FROM users WHERE username = %s", (username,))
+            return cursor.fetchone()
+
+    def replace_password_hash(self, user_id, old_hash, new_hash):
+        """Заменяет хеш, только если пароль не сменили параллельно."""
+        with self.db.cursor() as cursor:
+            cursor.execute("UPDATE users SET password = %s WHERE id = %s AND password = %s",
+                           (new_hash, user_id, old_hash))
+            return cursor.rowcount == 1
+
+    def record_login(self, user_id):
+        with self.db.cursor() as cursor:
+            cursor.execute("UPDATE users SET last_login = now() WHERE id = %s", (user_id,))
 
     def edit_user(self, user_id, **kwargs):
         try:
@@ -41,29 +155,29 @@ class UserManager:
 
             values.append(user_id)
             query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s"
-            self.cursor.execute(query, values)
-            self.conn.commit()
+            with self.db.cursor() as cursor:
+                cursor.execute(query, values)
             print("User  updated successfully.")
         except Exception as e:
             print(f"Error updating user: {str(e)}")
-            self.conn.rollback()
 
     def delete_user(self, user_id):
         try:
-            self.cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
-            self.conn.commit()
+            with self.db.cursor() as cursor:
+                cursor.execute("DELETE FROM users WHERE id = %s", (user_id,))
             print("User  deleted successfully.")
         except Exception as e:
             print(f"Error deleting user: {str(e)}")
-            self.conn.rollback()
 
     def login_user(self, username, password):
         try:
-            self.cursor.execute("SELECT password FROM users WHERE username = %s", (username,))
-            user = self.cursor.fetchone()
+            user = self.get_credentials(username)
             if user:
-                hashed_password = user[0]
+                user_id, hashed_password = user[:2]
                 if self.verify_password(password, hashed_password):
+                    if self.hasher.needs_rehash(hashed_password):
+                        self.replace_password_hash(user_id, hashed_password, self.hash_password(password))
+                    self.record_login(user_id)
                     print("Login successful.")
                     return True  # User logged in successfully
                 else:
@@ -80,7 +194,11 @@ class UserManager:
         """Fetches user details based on any given parameters."""
         try:
             # Construct the base query
-            base_query = "SELECT username, email, phone, name, description, avatar, birth, city, sports, events, root, admin FROM users WHERE "
+            # events - соревнования, на которые пользователь зарегистрирован (таблица event_registrations)
+            base_query = ("SELECT username, email, phone, name, description, avatar, birth, city, sports, "
+                          "ARRAY(SELECT competition_id FROM event_registrations "
+                          "WHERE user_id = users.id AND status = 'registered' ORDER BY created_at), "
+                          "root, admin FROM users WHERE ")
             conditions = []
             values = []
 
@@ -96,8 +214,9 @@ class UserManager:
 
             # Combine conditions into the query
             query = base_query + " AND ".join(conditions)
-            self.cursor.execute(query, values)
-            users = self.cursor.fetchall()
+            with self.db.cursor() as cursor:
+                cursor.execute(query, values)
+                users = cursor.fetchall()
 
             if multiple:
                 # Return a list of users
@@ -144,7 +263,54 @@ class UserManager:
             print(f"Error fetching user: {str(e)}")
             return None
 
-    def close(self):
-        self.cursor.close()
-        self.conn.close()
+    def find_users(self, city=None, sports_all=None, sports_any=None, events_all=None, events_any=None,
+                   limit=50, after=None):
+        """
+        Ищет пользователей по городу, видам спорта и соревнованиям, на которые они зарегистрированы.
+
+        Условия на sports - операторы массивов @> (все виды) и && (хотя бы один) по GIN-индексу; город -
+        по B-tree (city, id), условия на соревнования - по первичному ключу event_registrations.
+        Страницы выдаются по ключу id, поэтому глубина страницы не влияет на стоимость запроса. Для
+        каждого набора условий оператор подготавливается на сервере один раз на соединение.
+
+        :param sports_all: Пользователь занимается всеми этими видами спорта.
+        :param sports_any: Пользователь занимается хотя бы одним из видов спорта.
+        :param events_all: Пользователь зарегистрирован на все эти соревнования.
+        :param events_any: Пользователь зарегистрирован хотя бы на одно из соревнований.
+        :param after: Курсор - id последнего пользователя предыдущей страницы.
+        :return: (пользователи - словари по USER_SEARCH_COLUMNS, курсор следующей страницы или None).
+        """
+        conditions, types, params, names = [], [], [], []
+
+        def add(name, condition, type_name, value):
+            params.append(value)
+            types.append(type_name)
+            names.append(name)
+            conditions.append(condition.format(f"${len(params)}"))
+
+        add("after", "id > {}", "integer", after or 0)
+        if city is not None:
+            add("city", "city = {}", "varchar", city)
+        if sports_all:
+            add("sports_all", "sports @> {}", "varchar[]", sorted(set(sports_all)))
+        if sports_any:
+            add("sports_any", "sports && {}", "varchar[]", sorted(set(sports_any)))
+        if events_all:
+            add("events_all", "id IN (SELECT user_id FROM event_registrations "
+                              "WHERE competition_id = ANY({0}) AND status = 'registered' "
+                              "GROUP BY user_id HAVING count(*) = cardinality({0}))",
+                "integer[]", sorted(set(events_all)))
+        if events_any:
+            add("events_any", "id IN (SELECT user_id FROM event_registrations "
+                              "WHERE competition_id = ANY({}) AND status = 'registered')",
+                "integer[]", sorted(set(events_any)))
+        params.append(limit + 1)
+        types.append("integer")
 
+        statement = (f"SELECT {', '.join(USER_SEARCH_COLUMNS)} FROM users WHERE {' AND '.join(conditions)} "
+                     f"ORDER BY id LIMIT ${len(params)}")
+        with self.db.cursor() as cursor:
+            self.db.execute_prepared(cursor, "find_users_" + "_".join(names), statement, types, params)
+            rows = cursor.fetchall()
+        users = [dict(zip(USER_SEARCH_COLUMNS, row)) for row in rows[:limit]]
+        return users, (users[-1]["id"] if len(rows) > limit else None)
@@ -0,0 +1,87 @@
+"""
+Исполнитель заданий на загрузку PDF календаря ЕКП.
+
+Запускается отдельным процессом (сервис ingest_worker в docker-compose), чтобы разбор больших PDF
+не конкурировал с обработкой запросов API. Забирает задания из очереди Redis, которую наполняет
+/upload_pdf_db, и пишет прогресс в хеш задания; API отдаёт его через GET /ingest/{job_id}.
+
+Переменные окружения:
+- DATABASE_URL, REDIS_HOST - те же, что у API;
+- INGEST_WORKERS - сколько заданий обрабатывать одновременно (по процессу на задание, по умолчанию 1);
+- INGEST_WORKER_NAME - имя исполнителя, по которому после перезапуска находятся его незавершённые задания;
+- PDF_PARSE_WORKERS - наибольшее число процессов для разбора страниц одного PDF (по умолчанию 1); процессов не
+  больше доступных ядер, а короткие PDF разбираются последовательно;
+- PDF_PARSE_ENGINE - движок разбора страниц: lines (по умолчанию) или columns (по координатам колонок);
+- PDF_INGEST_CHUNK_SIZE - сколько соревнований сохранять в одной транзакции.
+"""
+import multiprocessing
+import os
+import socket
+import traceback
+from modules.competitions_controller import CompetitionStore
+from modules.db_controller import Database
+from modules.ingest_controller import IngestQueue, PdfRegistry, run_ingest_job
+from modules.schema import create_schema
+
+POSTGRES_URL = os.getenv("DATABASE_URL")
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "1"))
+INGEST_WORKER_NAME = os.getenv("INGEST_WORKER_NAME", socket.gethostname())
+PDF_PARSE_WORKERS = int(os.getenv("PDF_PARSE_WORKERS", "1"))
+PDF_PARSE_ENGINE = os.getenv("PDF_PARSE_ENGINE", "lines")
+PDF_INGEST_CHUNK_SIZE = int(os.getenv("PDF_INGEST_CHUNK_SIZE", "500"))
+
+
+def run_worker(worker_name):
+    """Цикл одного исполнителя: одно задание за раз."""
+    db = Database(POSTGRES_URL, min_size=1, max_size=2)
+    store = CompetitionStore(db)
+    registry = PdfRegistry(db)
+    queue = IngestQueue(REDIS_HOST)
+
+    for job_id in queue.recover(worker_name):
+        print(f"[{worker_name}] Requeued interrupted job {job_id}")
+
+    while True:
+        job_id = queue.take(worker_name)
+        if job_id is None:
+            continue
+        print(f"[{worker_name}] Processing job {job_id}")
+        try:
+            run_ingest_job(queue, job_id, store, registry,
+                           chunk_size=PDF_INGEST_CHUNK_SIZE, parse_workers=PDF_PARSE_WORKERS,
+                           parse_engine=PDF_PARSE_ENGINE)
+        except Exception as e:
+            traceback.print_exc()
+            queue.finish(worker_name, job_id, "failed", str(e))
+        else:
+            queue.finish(worker_name, job_id, "done")
+            print(f"[{worker_name}] Finished job {job_id}: {queue.get(job_id)}")
+        finally:
+            job = queue.get(job_id)
+            if job and job["state"] in ("done", "failed") and os.path.exists(job["file_path"]):
+                os.remove(job["file_path"])
+
+
+def main():
+    db = Database(POSTGRES_URL, min_size=1, max_size=1)
+    with db.connection() as conn:
+        create_schema(conn)
+    db.close()
+
+    if INGEST_WORKERS <= 1:
+        run_worker(INGEST_WORKER_NAME)
+        return
+
+    # Отдельные процессы, а не потоки: разбор PDF упирается в GIL
+    context = multiprocessing.get_context("spawn")
+    processes = [context.Process(target=run_worker, args=(f"{INGEST_WORKER_NAME}-{slot}",))
+                 for slot in range(INGEST_WORKERS)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -13,7 +13,9 @@ def index():
 def upload_pdf():
     if request.method == "POST":
         file = request.files["file"]
-        response = requests.post(f"{BASE_URL}/upload_pdf_db", files={"file": file})
+        # Отправляем тело как поток, а не собираем multipart-запрос в памяти
+        response = requests.post(f"{BASE_URL}/upload_pdf_db/stream", params={"filename": file.filename},
+                                 data=file.stream, headers={"Content-Type": "application/pdf"})
         return render_template("upload_pdf.html", message=response.json().get("message"))
     return render_template("upload_pdf.html")
 